@@ -1,37 +1,1334 @@
 import os
+import atexit
+import re
 import json
+import uuid
+import queue
+import bisect
+import collections
+import heapq
+import time
 import random
+import functools
+import socket
+import sqlite3
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows 開發環境沒有 fcntl
+    fcntl = None
 from datetime import datetime, timedelta
-from flask import Flask, request, abort
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from flask import Flask, Response, request, abort
 
+import requests
 import gspread
+from gspread.exceptions import APIError, SpreadsheetNotFound, WorksheetNotFound
+from gspread.utils import rowcol_to_a1
+from requests.adapters import HTTPAdapter
 from google.oauth2.service_account import Credentials
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
+from linebot.exceptions import LineBotApiError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
 
 # 初始化 Flask 與 APScheduler
 app = Flask(__name__)
-scheduler = BackgroundScheduler()
-scheduler.start()
+# 🆕 錯過執行時間的工作在寬限時間內補執行，多次錯過只補一次
+SCHEDULER_MISFIRE_GRACE = int(os.getenv("SCHEDULER_MISFIRE_GRACE", 300))
+scheduler = BackgroundScheduler(job_defaults={
+    "coalesce": True,
+    "misfire_grace_time": SCHEDULER_MISFIRE_GRACE
+})  # 由 start_background_services() 啟動，避免 import 時就建立執行緒
+
+# 🆕 監控指標：輕量的 Prometheus 文字格式指標，由 /metrics 提供
+metrics_registry = []
+
+class Metric:
+    """指標基底類別；callback 可回傳數值，或 [(標籤 dict, 數值)] 以讀取既有的統計數字"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+        metrics_registry.append(self)
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ""
+        escaped = (
+            (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for key, value in labels
+        )
+        return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+    def samples(self):
+        """回傳 [(名稱後綴, 標籤 tuple, 數值)]"""
+        if self.callback is not None:
+            value = self.callback()
+            if isinstance(value, (int, float)):
+                return [("", (), value)]
+            return [("", tuple(sorted(labels.items())), v) for labels, v in value]
+        with self._lock:
+            return [("", labels, value) for labels, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{self._format_labels(labels)} {value}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 每個區間各自的次數（輸出時再累加）、總和、次數
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """以 with 區塊計時"""
+        return _HistogramTimer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            values = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        for labels, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", labels + (("le", bound),), cumulative))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return samples
+
+class _HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+def render_metrics():
+    """將所有指標輸出成 Prometheus 文字格式"""
+    parts = []
+    for metric in metrics_registry:
+        try:
+            parts.append(metric.render())
+        except Exception as e:
+            print(f"⚠️ 讀取指標 {metric.name} 失敗：{e}")
+    return "\n".join(parts) + "\n"
+
+WEBHOOK_REQUEST_SECONDS = Histogram("linebot_webhook_request_seconds", "Time to validate and enqueue a webhook request")
+WEBHOOK_EVENT_SECONDS = Histogram("linebot_webhook_event_seconds", "Time to handle a webhook body, including replies")
+SHEETS_CALL_SECONDS = Histogram("linebot_sheets_call_seconds", "Google Sheets API call latency by operation")
+SHEETS_CALL_ERRORS = Counter("linebot_sheets_call_errors_total", "Failed Google Sheets API calls by operation")
+PUSH_SECONDS = Histogram("linebot_push_seconds", "LINE push latency from enqueue to completion, including retries")
+PUSH_TOTAL = Counter("linebot_push_total", "LINE push requests by method and outcome")
+REMINDER_LAG_SECONDS = Histogram(
+    "linebot_reminder_lag_seconds", "Actual minus scheduled send time of delivered reminders",
+    buckets=(0.05, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 1800)
+)
+JOB_DURATION_SECONDS = Histogram("linebot_job_duration_seconds", "Background job duration by job")
+
+# 🆕 本地 SQLite 資料庫（倒數計時等需要跨重啟保存的狀態）
+BOT_DB_PATH = os.getenv("BOT_DB_PATH", "bot.db")
+
+# 🆕 目前行程的識別碼（多個 worker 行程共用同一個資料庫時用來區分資料擁有者）
+PROCESS_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def db_connect():
+    """開啟本地資料庫連線（每次操作各自開啟，可安全跨執行緒使用）"""
+    return sqlite3.connect(BOT_DB_PATH, timeout=30)
+
+with db_connect() as conn:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS countdowns ("
+        "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, minutes INTEGER NOT NULL, run_at REAL NOT NULL)"
+    )
 
 # LINE 機器人驗證資訊
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
 LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+LINE_API_ENDPOINT = os.getenv("LINE_API_ENDPOINT", "https://api.line.me")
+line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
-# Google Sheets 授權
-SERVICE_ACCOUNT_INFO = json.loads(os.getenv("GOOGLE_CREDENTIALS_JSON"))
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
-credentials = Credentials.from_service_account_info(SERVICE_ACCOUNT_INFO, scopes=SCOPES)
-gc = gspread.authorize(credentials)
+# 🆕 推播派送：佇列 + 工作執行緒 + token bucket 限流，429/5xx 時加入抖動重試
+PUSH_WORKERS = int(os.getenv("PUSH_WORKERS", 4))
+PUSH_RATE_LIMIT = float(os.getenv("PUSH_RATE_LIMIT", 2000))  # LINE push API：每秒 2,000 次
+MULTICAST_RATE_LIMIT = float(os.getenv("MULTICAST_RATE_LIMIT", 200))  # LINE multicast API：每秒 200 次
+PUSH_MAX_RETRIES = int(os.getenv("PUSH_MAX_RETRIES", 3))
+LINE_MAX_MESSAGES = 5       # 每次 push / multicast / reply 最多 5 則訊息
+LINE_MULTICAST_MAX = 500    # 每次 multicast 最多 500 位使用者
+LINE_MAX_TEXT_LENGTH = 5000 # 每則文字訊息最多 5000 字（以 UTF-16 計算）
+
+class TokenBucket:
+    """簡單的 token bucket 限流器"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class PushDispatcher:
+    """LINE 推播派送器，push() 回傳 Future，推播成功時結果為 None
+
+    LineBotApi 把 retry key 存在實例共用的 headers 中，同一個實例不能在多個執行緒同時推播，
+    所以每個工作執行緒以 make_api() 建立自己的實例。
+    """
+
+    def __init__(self, make_api, workers=PUSH_WORKERS, rate=PUSH_RATE_LIMIT,
+                 multicast_rate=MULTICAST_RATE_LIMIT, max_retries=PUSH_MAX_RETRIES):
+        self.make_api = make_api
+        self.workers = workers
+        self.max_retries = max_retries
+        # push 與 multicast 的速率限制各自計算
+        self.buckets = {"push_message": TokenBucket(rate), "multicast": TokenBucket(multicast_rate)}
+        self.sent_count = 0
+        self.failed_count = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"push-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _submit(self, method, to, messages, retry_key):
+        future = Future()
+        self._ensure_workers()
+        self._queue.put((method, to, messages, retry_key or str(uuid.uuid4()), future, time.monotonic()))
+        return future
+
+    def push(self, to, messages, retry_key=None):
+        """retry_key 相同的推播在 LINE 端只會送達一次，未指定時每次推播自動產生"""
+        return self._submit("push_message", to, messages, retry_key)
+
+    def multicast(self, to, messages, retry_key=None):
+        """同樣的訊息一次送給多位使用者（只接受 U 開頭的使用者 ID，最多 LINE_MULTICAST_MAX 位）"""
+        return self._submit("multicast", list(to), messages, retry_key)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _should_retry(self, error):
+        if isinstance(error, LineBotApiError):
+            return error.status_code == 429 or error.status_code >= 500
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    def _send(self, api, method, to, messages, retry_key):
+        # 同一則訊息重試時沿用相同的 retry key，LINE 端會自動去除重複
+        send = getattr(api, method)
+        for attempt in range(self.max_retries + 1):
+            self.buckets[method].acquire()
+            try:
+                send(to, messages, retry_key=retry_key)
+                return
+            except Exception as e:
+                # 409 表示相同 retry key 的請求先前已被接受
+                if isinstance(e, LineBotApiError) and e.status_code == 409:
+                    return
+                if attempt >= self.max_retries or not self._should_retry(e):
+                    raise
+                delay = 0.5 * (2 ** attempt) + random.uniform(0, 0.5)
+                print(f"⚠️ 推播給 {to} 失敗，{delay:.1f} 秒後重試：{e}")
+                time.sleep(delay)
+
+    def _worker(self):
+        api = self.make_api()
+        while True:
+            method, to, messages, retry_key, future, enqueued_at = self._queue.get()
+            error = None
+            try:
+                self._send(api, method, to, messages, retry_key)
+            except Exception as e:
+                error = e
+            latency = time.monotonic() - enqueued_at
+            with self._lock:
+                if error is None:
+                    self.sent_count += 1
+                else:
+                    self.failed_count += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            PUSH_SECONDS.observe(latency, method=method)
+            PUSH_TOTAL.inc(method=method, outcome="success" if error is None else "failure")
+            print(f"📨 推播給 {to if isinstance(to, str) else f'{len(to)} 位使用者'} 耗時 {latency * 1000:.0f} ms")
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+            self._queue.task_done()
+
+push_dispatcher = PushDispatcher(lambda: LineBotApi(LINE_CHANNEL_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT))
+
+def text_length(text):
+    """LINE 以 UTF-16 計算訊息長度，emoji 算兩個字"""
+    return len(text.encode("utf-16-le")) // 2
+
+# 🆕 長訊息分頁：超過 LINE 單則訊息上限時切成多則，盡量在空白行（日期分段）切開
+def paginate_text(text, limit=LINE_MAX_TEXT_LENGTH, max_messages=LINE_MAX_MESSAGES):
+    """回傳最多 max_messages 則訊息，放不下的部分截斷並加上提示"""
+    if text_length(text) <= limit:
+        return [text]
+    pages, page, size = [], [], 0
+    for line in text.split("\n"):
+        # 單行就超過上限時直接切開（以字元數的一半切，確保 emoji 也放得下）
+        while text_length(line) >= limit:
+            pages.append(page)
+            page, size = [], 0
+            pages.append([line[:limit // 2]])
+            line = line[limit // 2:]
+        length = text_length(line) + 1
+        if page and size + length > limit:
+            cut = next((k for k in range(len(page) - 1, 0, -1) if not page[k]), len(page))
+            pages.append(page[:cut])
+            page = page[cut:]
+            size = sum(text_length(item) + 1 for item in page)
+            # 空白行之後剩下的部分加上這一行仍可能超過上限，這時在這一行之前直接換頁
+            if size + length > limit:
+                pages.append(page)
+                page, size = [], 0
+        page.append(line)
+        size += length
+    pages.append(page)
+    pages = ["\n".join(page).strip("\n") for page in pages]
+    pages = [page for page in pages if page]
+    if len(pages) > max_messages:
+        note = f"⚠️ 內容太長，只顯示前 {max_messages} 則訊息，請改查詢較短的期間"
+        pages = pages[:max_messages]
+        last = pages[-1].split("\n")
+        budget = limit - text_length(note) - 2
+        while len(last) > 1 and text_length("\n".join(last)) > budget:
+            last.pop()
+        # 只剩一行仍放不下時截短該行；每刪一個字元至少少一個 UTF-16 單位
+        kept = "\n".join(last)
+        excess = text_length(kept) - budget
+        if excess > 0:
+            kept = kept[:len(kept) - excess]
+        pages[-1] = kept + "\n\n" + note
+    return pages
+
+# Google Sheets 授權（🆕 第一次使用時才建立連線，加快啟動速度）
+# drive.metadata.readonly 只用來讀取試算表的最後修改時間，判斷是否需要重新讀取
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive.metadata.readonly"]
 spreadsheet_id = os.getenv("GOOGLE_SPREADSHEET_ID")
-sheet = gc.open_by_key(spreadsheet_id).sheet1
+SHEETS_POOL_SIZE = int(os.getenv("SHEETS_POOL_SIZE", 10))
+_gc = None
+_gc_lock = threading.Lock()
+
+def get_gc():
+    """取得 gspread client，所有試算表共用同一個 HTTP session 與連線池"""
+    global _gc
+    with _gc_lock:
+        if _gc is None:
+            service_account_info = json.loads(os.getenv("GOOGLE_CREDENTIALS_JSON"))
+            credentials = Credentials.from_service_account_info(service_account_info, scopes=SCOPES)
+            client = gspread.authorize(credentials)
+            session = getattr(getattr(client, "http_client", None), "session", None)
+            if session is not None:
+                session.mount("https://", HTTPAdapter(pool_connections=SHEETS_POOL_SIZE, pool_maxsize=SHEETS_POOL_SIZE))
+            _gc = client
+        return _gc
+
+class WorksheetRegistry:
+    """快取已開啟的試算表與工作表，避免每次寫入前重複查詢中繼資料"""
+
+    def __init__(self, get_client):
+        self.get_client = get_client
+        self._spreadsheets = {}
+        self._worksheets = {}
+        self._lock = threading.Lock()
+
+    def get(self, spreadsheet_id, worksheet_name=None):
+        """取得工作表（worksheet_name 為 None 時取第一個工作表）"""
+        key = (spreadsheet_id, worksheet_name)
+        with self._lock:
+            if key not in self._worksheets:
+                if spreadsheet_id not in self._spreadsheets:
+                    self._spreadsheets[spreadsheet_id] = self.get_client().open_by_key(spreadsheet_id)
+                spreadsheet = self._spreadsheets[spreadsheet_id]
+                self._worksheets[key] = spreadsheet.sheet1 if worksheet_name is None else spreadsheet.worksheet(worksheet_name)
+            return self._worksheets[key]
+
+    def refresh(self, spreadsheet_id, worksheet_name=None):
+        with self._lock:
+            self._spreadsheets.pop(spreadsheet_id, None)
+            self._worksheets.pop((spreadsheet_id, worksheet_name), None)
+
+    def call(self, spreadsheet_id, worksheet_name, func):
+        """對工作表執行 func；授權或找不到工作表的錯誤時重新開啟後再試一次"""
+        try:
+            return func(self.get(spreadsheet_id, worksheet_name))
+        except (APIError, SpreadsheetNotFound, WorksheetNotFound) as e:
+            if isinstance(e, APIError) and e.code not in (400, 401, 403, 404):
+                raise
+            print(f"⚠️ 工作表連線失效，重新開啟：{e}")
+            self.refresh(spreadsheet_id, worksheet_name)
+            return func(self.get(spreadsheet_id, worksheet_name))
+
+    def handle(self, spreadsheet_id, worksheet_name=None):
+        return WorksheetHandle(self, spreadsheet_id, worksheet_name)
+
+class WorksheetHandle:
+    """長期使用的工作表代理物件，方法呼叫都經由 WorksheetRegistry.call()"""
+
+    def __init__(self, registry, spreadsheet_id, worksheet_name=None):
+        self._registry = registry
+        self._spreadsheet_id = spreadsheet_id
+        self._worksheet_name = worksheet_name
+
+    def __getattr__(self, name):
+        attr = getattr(self._registry.get(self._spreadsheet_id, self._worksheet_name), name)
+        if not callable(attr):
+            return attr
+
+        def method(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return self._registry.call(
+                    self._spreadsheet_id, self._worksheet_name,
+                    lambda worksheet: getattr(worksheet, name)(*args, **kwargs)
+                )
+            except Exception:
+                SHEETS_CALL_ERRORS.inc(operation=name)
+                raise
+            finally:
+                SHEETS_CALL_SECONDS.observe(time.perf_counter() - start, operation=name)
+        return method
+
+worksheet_registry = WorksheetRegistry(get_gc)
+sheet = worksheet_registry.handle(spreadsheet_id)
+
+# 🆕 行程資料以本地 SQLite 為主，Google 試算表改由背景工作非同步同步（replica）
+SHEET_SYNC_INTERVAL = int(os.getenv("SHEET_SYNC_INTERVAL", 15))
+SHEET_PULL_INTERVAL = int(os.getenv("SHEET_PULL_INTERVAL", 60))
+SHEET_FLUSH_RETRIES = int(os.getenv("SHEET_FLUSH_RETRIES", 3))
+REMINDER_LEASE_SECONDS = int(os.getenv("REMINDER_LEASE_SECONDS", 60))
+
+def parse_lead_times(spec):
+    """解析提醒提前時間設定，例如 "1d,1h,10m"，回傳 (timedelta, 顯示文字) 列表"""
+    units = {"d": ("days", "天"), "h": ("hours", "小時"), "m": ("minutes", "分鐘")}
+    lead_times = []
+    for item in spec.split(","):
+        item = item.strip().lower()
+        if len(item) < 2 or item[-1] not in units or not item[:-1].isdigit():
+            if item:
+                print(f"⚠️ 無法解析提醒時間設定：{item}")
+            continue
+        amount = int(item[:-1])
+        unit, name = units[item[-1]]
+        label = f"一{name}" if amount == 1 and item[-1] != "m" else f"{amount}{name}"
+        lead_times.append((timedelta(**{unit: amount}), label))
+    return sorted(lead_times, reverse=True) or [(timedelta(hours=1), "一小時")]
+
+# 行程前多久發送提醒，例如 "1d,1h,10m"
+REMINDER_LEAD_TIMES = parse_lead_times(os.getenv("REMINDER_LEAD_TIMES", "1h"))
+
+# 🆕 解析結果快取：同一組日期、時間字串只解析一次（包含格式錯誤的結果）
+SHEET_DATETIME_CACHE_SIZE = int(os.getenv("SHEET_DATETIME_CACHE_SIZE", 4096))
+
+@functools.lru_cache(maxsize=SHEET_DATETIME_CACHE_SIZE)
+def parse_sheet_datetime(date_str, time_str):
+    """快速解析工作表固定格式的日期（%Y/%m/%d）與時間（%H:%M），格式錯誤時回傳 None"""
+    date_parts = date_str.strip().split("/")
+    time_parts = time_str.strip().split(":")
+    if len(date_parts) != 3 or len(time_parts) != 2:
+        return None
+    year, month, day = date_parts
+    hour, minute = time_parts
+    if not (len(year) == 4 and 0 < len(month) <= 2 and 0 < len(day) <= 2 and 0 < len(hour) <= 2 and 0 < len(minute) <= 2):
+        return None
+    if not (year + month + day + hour + minute).isdecimal():
+        return None
+    try:
+        return datetime(int(year), int(month), int(day), int(hour), int(minute))
+    except ValueError:
+        return None
+
+def sheet_datetime_cache_stats():
+    """回傳日期時間解析快取的命中統計"""
+    info = parse_sheet_datetime.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+    }
+
+def parse_due_at(date_str, time_str):
+    """將工作表的日期、時間欄位轉成 timestamp，格式錯誤時回傳 None"""
+    dt = parse_sheet_datetime(date_str, time_str)
+    return dt.timestamp() if dt else None
+
+class ScheduleStore:
+    """行程與提醒資料的本地資料庫"""
+
+    def __init__(self, connect=db_connect):
+        self.connect = connect
+        with self.connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS schedules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT '',
+                    due_at REAL,
+                    sheet_row INTEGER,
+                    synced TEXT,
+                    dirty INTEGER NOT NULL DEFAULT 0,
+                    rev INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_schedules_user_due ON schedules (user_id COLLATE NOCASE, due_at);
+                CREATE INDEX IF NOT EXISTS idx_schedules_status_due ON schedules (status, due_at);
+                CREATE INDEX IF NOT EXISTS idx_schedules_due ON schedules (due_at);
+                CREATE INDEX IF NOT EXISTS idx_schedules_sheet_row ON schedules (sheet_row);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('schedules_version', '0');
+                CREATE TABLE IF NOT EXISTS schedule_archive (
+                    id INTEGER PRIMARY KEY,
+                    date TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT '',
+                    due_at REAL,
+                    archived_at REAL NOT NULL
+                );
+            """)
+            # 資料庫建立時產生一次的隨機識別碼：資料庫重建後 id 會從 1 重新開始，
+            # 提醒的 retry key 必須跟舊資料庫的區隔開，否則 LINE 會把新提醒當成已送達的重送
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('instance_id', ?)", (uuid.uuid4().hex,))
+            self.instance_id = conn.execute("SELECT value FROM meta WHERE key = 'instance_id'").fetchone()[0]
+            # 舊版資料庫補上發送租約欄位
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(schedules)")}
+            if "claim_owner" not in columns:
+                conn.execute("ALTER TABLE schedules ADD COLUMN claim_owner TEXT")
+                conn.execute("ALTER TABLE schedules ADD COLUMN lease_until REAL")
+            # 舊版封存資料表補上「已寫入封存工作表」欄位；先前的版本是先寫工作表才寫入本地，既有資料都已寫入
+            archive_columns = {row[1] for row in conn.execute("PRAGMA table_info(schedule_archive)")}
+            if "sheet_archived" not in archive_columns:
+                conn.execute("ALTER TABLE schedule_archive ADD COLUMN sheet_archived INTEGER NOT NULL DEFAULT 0")
+                conn.execute("UPDATE schedule_archive SET sheet_archived = 1")
+            # 舊版資料庫補上「試算表 F 欄已寫入識別碼」欄位
+            if "keyed" not in columns:
+                conn.execute("ALTER TABLE schedules ADD COLUMN keyed INTEGER NOT NULL DEFAULT 0")
+            # 舊版 F 欄只寫本地 id，無法分辨是不是這個資料庫寫入的：全部改依內容對應一次，並補寫新格式的識別碼
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'sheet_key_format'").fetchone() is None:
+                conn.execute("UPDATE schedules SET keyed = 0")
+                conn.execute("INSERT INTO meta (key, value) VALUES ('sheet_key_format', 'instance')")
+
+    def version(self):
+        """資料被同步或外部修改時遞增，記憶體中的索引據此判斷是否需要重建"""
+        with self.connect() as conn:
+            return int(conn.execute("SELECT value FROM meta WHERE key = 'schedules_version'").fetchone()[0])
+
+    def _bump_version(self, conn):
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'schedules_version'")
+
+    def add_rows(self, rows):
+        """在同一個交易中新增多列（日期, 時間, 內容, 使用者, 狀態），回傳新資料的 id"""
+        with self.connect() as conn:
+            ids = []
+            for date_str, time_str, content, user_id, status in rows:
+                cursor = conn.execute(
+                    "INSERT INTO schedules (date, time, content, user_id, status, due_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (date_str, time_str, content, user_id, status, parse_due_at(date_str, time_str))
+                )
+                ids.append(cursor.lastrowid)
+            return ids
+
+    def retry_key(self, row_ids):
+        """同一組提醒在這個資料庫中永遠得到相同的 LINE retry key，不同資料庫之間不會重複"""
+        name = f"reminder/{self.instance_id}/{'-'.join(map(str, sorted(row_ids)))}"
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+
+    def claim(self, row_id, lease_seconds=REMINDER_LEASE_SECONDS):
+        """取得提醒的發送權（待發送 → 發送中），租約過期的發送中提醒可被重新取得"""
+        now = time.time()
+        with self.connect() as conn:
+            return conn.execute(
+                "UPDATE schedules SET status = '發送中', claim_owner = ?, lease_until = ? "
+                "WHERE id = ? AND (status = '待發送' OR (status = '發送中' AND lease_until < ?))",
+                (PROCESS_ID, now + lease_seconds, row_id, now)
+            ).rowcount == 1
+
+    def renew(self, row_ids, lease_seconds=None):
+        """延長本行程持有的租約，回傳仍由本行程持有的筆數"""
+        lease_seconds = REMINDER_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        lease_until = time.time() + lease_seconds
+        with self.connect() as conn:
+            return conn.executemany(
+                "UPDATE schedules SET lease_until = ? WHERE id = ? AND status = '發送中' AND claim_owner = ?",
+                [(lease_until, row_id, PROCESS_ID) for row_id in row_ids]
+            ).rowcount
+
+    def confirm(self, row_id, status):
+        """以發送結果結束租約，租約已被其他行程接手時回傳 False"""
+        with self.connect() as conn:
+            return conn.execute(
+                "UPDATE schedules SET status = ?, claim_owner = NULL, lease_until = NULL, dirty = 1, rev = rev + 1 "
+                "WHERE id = ? AND status = '發送中' AND claim_owner = ?",
+                (status, row_id, PROCESS_ID)
+            ).rowcount == 1
+
+    def expired_claims(self):
+        """取得發送中但租約已過期（例如行程當機）的提醒"""
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT id, due_at, content, user_id FROM schedules "
+                "WHERE status = '發送中' AND lease_until < ? AND due_at IS NOT NULL",
+                (time.time(),)
+            ).fetchall()
+
+    def rows_after(self, last_id):
+        """取得 id 大於 last_id 的資料列（id, due_at, content, user_id, status）"""
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT id, due_at, content, user_id, status FROM schedules WHERE id > ? ORDER BY id",
+                (last_id,)
+            ).fetchall()
+
+    def pending_reminders(self, after_id=0):
+        with self.connect() as conn:
+            return conn.execute(
+                "SELECT id, due_at, content, user_id FROM schedules "
+                "WHERE status = '待發送' AND due_at IS NOT NULL AND id > ?",
+                (after_id,)
+            ).fetchall()
+
+schedule_store = ScheduleStore()
+
+# 🆕 分段讀取試算表：每次只取 SHEET_PAGE_ROWS 列，記憶體用量不隨歷史資料增加。
+# 完整讀取一次需要 ceil(列數 / SHEET_PAGE_ROWS) + 1 次讀取（最後一次確認已到結尾）
+SHEET_PAGE_ROWS = int(os.getenv("SHEET_PAGE_ROWS", 5000))
+
+def iter_sheet_pages(worksheet, start_row=2, page_rows=SHEET_PAGE_ROWS, columns="A:E"):
+    """依序產生 (起始列號, 資料列) ；讀到整段空白時視為資料結尾"""
+    first_col, last_col = columns.split(":")
+    while True:
+        rows = worksheet.get(f"{first_col}{start_row}:{last_col}{start_row + page_rows - 1}")
+        if not rows:
+            return
+        yield start_row, rows
+        start_row += page_rows
+
+# 試算表 F 欄存放本地資料的 id（加上資料庫識別碼），列被插入、刪除或排序後仍能對應回同一筆資料
+SHEET_KEY_COLUMN = 6
+
+class SheetReplicator:
+    """將本地行程資料同步到 Google 試算表，並偵測直接在試算表中的修改"""
+
+    def __init__(self, store, worksheet, retries=SHEET_FLUSH_RETRIES):
+        self.store = store
+        self.worksheet = worksheet
+        self.retries = retries
+        self.conflict_count = 0
+        self._pulled_at = None
+        self._pulled_modified = None  # 上次完整讀取時試算表的修改時間
+        self._modified_warned = False
+        # 可重入：封存工作在持有鎖的期間會呼叫 push_changes / pull_changes
+        self._lock = threading.RLock()
+        self._push_requested = threading.Event()
+        self._push_thread = None
+        self._key_column_hidden = False
+
+    def _call(self, description, func, *args):
+        """呼叫試算表 API，失敗時指數退避重試"""
+        for attempt in range(self.retries):
+            try:
+                return func(*args)
+            except Exception as e:
+                print(f"❌ {description}失敗（第{attempt + 1}次）：{e}")
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def _modified_time(self):
+        """試算表的最後修改時間（Drive API，不佔用 Sheets 讀取配額），無法取得時回傳 None"""
+        try:
+            return self.worksheet.spreadsheet.get_lastUpdateTime()
+        except Exception as e:
+            if not self._modified_warned:
+                self._modified_warned = True
+                print(f"⚠️ 無法取得試算表修改時間，每次同步都會完整讀取試算表：{e}")
+            return None
+
+    def _unchanged_since_pull(self):
+        """上次完整讀取後試算表沒有任何修改（包括本程式自己的寫入）；修改時間可能比實際修改晚更新，列號仍需確認"""
+        return self._pulled_modified is not None and self._modified_time() == self._pulled_modified
+
+    def _hide_key_column(self):
+        """隱藏 F 欄（資料列識別碼），只做一次，失敗不影響同步"""
+        if self._key_column_hidden:
+            return
+        self._key_column_hidden = True
+        try:
+            self.worksheet.hide_columns(SHEET_KEY_COLUMN - 1, SHEET_KEY_COLUMN)
+        except Exception as e:
+            print(f"⚠️ 無法隱藏識別碼欄：{e}")
+
+    def _sheet_key(self, row_id):
+        """F 欄的識別碼；加上資料庫識別碼，資料庫重建後舊資料庫寫入的識別碼不會被當成本地資料"""
+        return f"{row_id}@{self.store.instance_id}"
+
+    def _local_id(self, key):
+        """F 欄識別碼對應的本地 id；空白、舊格式或其他資料庫寫入的識別碼回傳 None"""
+        row_id, _, instance_id = key.strip().partition("@")
+        if instance_id == self.store.instance_id and row_id.isascii() and row_id.isdigit():
+            return int(row_id)
+        return None
+
+    def _key_positions(self):
+        """讀取 F 欄，回傳 {識別碼: 列號}"""
+        keys = self._call("讀取識別碼欄", self.worksheet.col_values, SHEET_KEY_COLUMN)
+        return {key: sheet_row for sheet_row, key in enumerate(keys, start=1) if key}
+
+    def _append_unverified(self):
+        """先前的 append_rows 可能已經寫入但還沒記錄列號（記錄在資料庫，換 leader 或重啟後仍有效）"""
+        with self.store.connect() as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'sheet_append_unverified'").fetchone() is not None
+
+    def _append_rows(self, rows):
+        """以 append_rows 寫入新資料列（最後一欄為識別碼），回傳 {識別碼: 列號}
+
+        append_rows 不是冪等的：請求可能已經寫入才回傳錯誤，直接重試會重複新增。
+        送出前先在資料庫記下「可能已寫入」，呼叫端記錄列號後才清除；
+        這個標記存在時（失敗、當機或換 leader 之後），先讀 F 欄找出已寫入的列，只重送尚未寫入的部分。
+        """
+        positions = {}
+        for attempt in range(self.retries):
+            if self._append_unverified():
+                landed = self._key_positions()
+                positions.update({row[-1]: landed[row[-1]] for row in rows if row[-1] in landed})
+            pending = [row for row in rows if row[-1] not in positions]
+            if not pending:
+                break
+            with self.store.connect() as conn:
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('sheet_append_unverified', '1')")
+            try:
+                response = self.worksheet.append_rows(pending)
+            except Exception as e:
+                print(f"❌ 寫入新行程到試算表失敗（第{attempt + 1}次）：{e}")
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            match = re.search(r"![A-Z]+(\d+)", response.get("updates", {}).get("updatedRange", ""))
+            if not match:
+                # 已經寫入但不知道列號：標記保留，下次同步依 F 欄找出位置
+                raise RuntimeError("無法取得試算表新增資料的列號")
+            first_row = int(match.group(1))
+            positions.update({row[-1]: first_row + n for n, row in enumerate(pending)})
+            break
+        return positions
+
+    def push_changes(self):
+        """新資料以單次 append_rows 寫入（F 欄為本地 id），狀態變更依 F 欄找到目前列號後以單次 batch_update 寫回"""
+        with self._lock:
+            with self.store.connect() as conn:
+                new_rows = conn.execute(
+                    "SELECT id, date, time, content, user_id, status, rev FROM schedules "
+                    "WHERE sheet_row IS NULL ORDER BY id"
+                ).fetchall()
+                dirty_rows = conn.execute(
+                    "SELECT id, status, rev, synced, sheet_row FROM schedules "
+                    "WHERE dirty = 1 AND sheet_row IS NOT NULL AND keyed = 1"
+                ).fetchall()
+
+            if new_rows:
+                values = [list(row[1:6]) for row in new_rows]
+                positions = self._append_rows([value + [self._sheet_key(row[0])] for row, value in zip(new_rows, values)])
+                with self.store.connect() as conn:
+                    conn.executemany(
+                        "UPDATE schedules SET sheet_row = ?, synced = ?, keyed = 1, "
+                        "dirty = CASE WHEN rev = ? THEN 0 ELSE dirty END WHERE id = ?",
+                        [(positions[self._sheet_key(row[0])], json.dumps(value, ensure_ascii=False), row[6], row[0])
+                         for row, value in zip(new_rows, values)]
+                    )
+                    # 列號已記錄，下次新增不必再核對 F 欄
+                    conn.execute("DELETE FROM meta WHERE key = 'sheet_append_unverified'")
+                print(f"📤 已同步 {len(new_rows)} 筆新行程到試算表")
+                self._hide_key_column()
+
+            if dirty_rows:
+                located = None
+                if self._unchanged_since_pull():
+                    # 上次完整讀取後試算表沒有變動，本地記錄的列號應該就是目前位置；
+                    # 修改時間可能還沒反映剛才的插入或刪除，先以一次 batch_get 確認這些列的 F 欄
+                    cells = self._call(
+                        "確認識別碼", self.worksheet.batch_get,
+                        [rowcol_to_a1(row[4], SHEET_KEY_COLUMN) for row in dirty_rows]
+                    )
+                    if all(
+                        cell and cell[0] and cell[0][0] == self._sheet_key(row[0])
+                        for cell, row in zip(cells, dirty_rows)
+                    ):
+                        located = dirty_rows
+                if located is None:
+                    # 有人在試算表插入或刪除列時列號會改變，寫入前先依 F 欄的識別碼找出目前位置
+                    positions = self._key_positions()
+                    located = [
+                        row[:4] + (positions[self._sheet_key(row[0])],)
+                        for row in dirty_rows if self._sheet_key(row[0]) in positions
+                    ]
+                if not located:
+                    return
+                data = [
+                    {"range": rowcol_to_a1(sheet_row, 5), "values": [[status]]}
+                    for _, status, _, _, sheet_row in located
+                ]
+                self._call("批次寫回狀態", self.worksheet.batch_update, data)
+                with self.store.connect() as conn:
+                    for row_id, status, rev, synced, sheet_row in located:
+                        synced_values = json.loads(synced)[:4] + [status]
+                        # 寫回期間又被更新的資料留待下次同步
+                        conn.execute(
+                            "UPDATE schedules SET dirty = 0, synced = ?, sheet_row = ? WHERE id = ? AND rev = ?",
+                            (json.dumps(synced_values, ensure_ascii=False), sheet_row, row_id, rev)
+                        )
+
+    def _merge_row(self, conn, sheet_row, values, current):
+        """把試算表的一列合併到對應的本地資料，回傳是否有內容變更（只有列號改變視為移動，不算變更）"""
+        row_id, status, synced, dirty, local_row, claim_owner = current
+        synced_json = json.dumps(values, ensure_ascii=False)
+        if synced == synced_json:
+            if local_row != sheet_row:
+                conn.execute("UPDATE schedules SET sheet_row = ? WHERE id = ?", (sheet_row, row_id))
+            return False
+        if dirty or claim_owner:
+            # 兩邊都有修改：日期、時間、內容、使用者以試算表為準，狀態以機器人為準；
+            # 發送中的提醒也保留本地狀態，否則 confirm() 找不到發送中的資料，發送結果不會被記錄而重送
+            self.conflict_count += 1
+            print(f"⚠️ 第{sheet_row}行同時在試算表與本地被修改，保留本地狀態「{status}」")
+            values = values[:4] + [status]
+        conn.execute(
+            "UPDATE schedules SET date = ?, time = ?, content = ?, user_id = ?, status = ?, "
+            "due_at = ?, synced = ?, sheet_row = ? WHERE id = ?",
+            values + [parse_due_at(values[0], values[1]), synced_json, sheet_row, row_id]
+        )
+        return True
+
+    def _merge_page(self, conn, first_row, rows, seen, unkeyed, backfill):
+        """合併試算表從 first_row 開始的一段資料列，回傳變更筆數
+
+        有這個資料庫識別碼（F 欄）的列依 id 對應本地資料，插入或刪除列造成的位移只更新列號；
+        沒有識別碼（舊資料）或識別碼屬於其他資料庫的列，依內容對應尚未寫入識別碼的本地資料，都對不到時視為人工新增。
+        """
+        page = []
+        for sheet_row, row in enumerate(rows, start=first_row):
+            cells = (list(row) + [""] * 6)[:6]
+            page.append((sheet_row, cells[:5], self._local_id(cells[5])))
+        keys = [local_id for _, _, local_id in page if local_id is not None]
+        local = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            for row in conn.execute(
+                "SELECT id, status, synced, dirty, sheet_row, claim_owner FROM schedules "
+                f"WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ):
+                local[row[0]] = row
+        changed = 0
+        for sheet_row, values, local_id in page:
+            if not any(values):
+                continue
+            current = None
+            if local_id is not None and local_id not in seen:
+                current = local.get(local_id)
+            if current is None and local_id is None:
+                candidates = [
+                    c for c in unkeyed.get(json.dumps(values[:4], ensure_ascii=False), []) if c[0] not in seen
+                ]
+                if candidates:
+                    # 同內容有多筆時優先對應原本就在這一列的資料
+                    same_row = [c for c in candidates if c[4] == sheet_row]
+                    current = same_row[0] if same_row else candidates[0]
+                    backfill.append((sheet_row, current[0]))
+            if current is None:
+                # 人工新增的列（或複製貼上造成重複識別碼的列）：建立新資料並回寫識別碼
+                cursor = conn.execute(
+                    "INSERT INTO schedules (date, time, content, user_id, status, due_at, sheet_row, synced) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    values + [parse_due_at(values[0], values[1]), sheet_row, json.dumps(values, ensure_ascii=False)]
+                )
+                seen.add(cursor.lastrowid)
+                backfill.append((sheet_row, cursor.lastrowid))
+                changed += 1
+                continue
+            seen.add(current[0])
+            if local_id is not None:
+                conn.execute("UPDATE schedules SET keyed = 1 WHERE id = ? AND keyed = 0", (current[0],))
+            if self._merge_row(conn, sheet_row, values, current):
+                changed += 1
+        return changed
+
+    def _load_unkeyed(self):
+        """尚未在試算表寫入識別碼的本地資料，依日期、時間、內容、使用者分組"""
+        unkeyed = {}
+        with self.store.connect() as conn:
+            for row in conn.execute(
+                "SELECT id, status, synced, dirty, sheet_row, claim_owner FROM schedules "
+                "WHERE keyed = 0 AND sheet_row IS NOT NULL AND synced IS NOT NULL ORDER BY sheet_row"
+            ):
+                unkeyed.setdefault(json.dumps(json.loads(row[2])[:4], ensure_ascii=False), []).append(row)
+        return unkeyed
+
+    def pull_changes(self, force=False):
+        """分段讀取試算表，將人工新增、修改、刪除或搬移的資料合併回本地資料庫
+
+        試算表的修改時間與上次讀取時相同就不重新讀取（force=True 時一律讀取）。
+        """
+        with self._lock:
+            # 先取得修改時間再讀取：讀取期間的修改會讓下次的修改時間不同而重新讀取
+            modified = self._modified_time()
+            if not force and modified is not None and modified == self._pulled_modified:
+                self._pulled_at = time.monotonic()
+                return
+            self._pulled_modified = None
+            changed = 0
+            seen = set()
+            backfill = []
+            unkeyed = self._load_unkeyed()
+            # 從第2行開始（跳過標題行），每一段在自己的交易中合併，不會在等待 API 時鎖住資料庫
+            for first_row, rows in iter_sheet_pages(self.worksheet, start_row=2, columns="A:F"):
+                with self.store.connect() as conn:
+                    page_changed = self._merge_page(conn, first_row, rows, seen, unkeyed, backfill)
+                    if page_changed:
+                        self.store._bump_version(conn)
+                changed += page_changed
+            # 試算表中已不存在的列：未修改的直接刪除，有本地修改的重新寫入
+            with self.store.connect() as conn:
+                missing = [
+                    row for row in conn.execute("SELECT id, dirty FROM schedules WHERE sheet_row IS NOT NULL")
+                    if row[0] not in seen
+                ]
+                for row_id, dirty in missing:
+                    if dirty:
+                        conn.execute("UPDATE schedules SET sheet_row = NULL, keyed = 0 WHERE id = ?", (row_id,))
+                    else:
+                        conn.execute("DELETE FROM schedules WHERE id = ?", (row_id,))
+                if missing:
+                    self.store._bump_version(conn)
+            changed += len(missing)
+            if backfill:
+                # 新增或舊版的列補寫識別碼；失敗時下次同步會再依內容對應並重試
+                try:
+                    self._call("補寫識別碼", self.worksheet.batch_update, [
+                        {"range": rowcol_to_a1(sheet_row, SHEET_KEY_COLUMN), "values": [[self._sheet_key(row_id)]]}
+                        for sheet_row, row_id in backfill
+                    ])
+                    with self.store.connect() as conn:
+                        conn.executemany("UPDATE schedules SET keyed = 1 WHERE id = ?", [(row_id,) for _, row_id in backfill])
+                except Exception as e:
+                    print(f"❌ 補寫識別碼失敗：{e}")
+            self._pulled_at = time.monotonic()
+            self._pulled_modified = modified
+            if changed:
+                print(f"📥 已從試算表合併 {changed} 筆變更")
+
+    def sync(self, pull=True):
+        try:
+            self.push_changes()
+            if pull and (self._pulled_at is None or time.monotonic() - self._pulled_at >= SHEET_PULL_INTERVAL):
+                self.pull_changes()
+        except Exception as e:
+            print(f"❌ 同步試算表失敗：{e}")
+
+    def request_push(self):
+        """在背景執行緒寫回本地變更並立即返回，呼叫端不會被試算表 API 或同步鎖卡住"""
+        if self._push_thread is None:
+            self._push_thread = threading.Thread(target=self._push_worker, name="sheet-push", daemon=True)
+            self._push_thread.start()
+        self._push_requested.set()
+
+    def _push_worker(self):
+        while True:
+            self._push_requested.wait()
+            self._push_requested.clear()
+            self.sync(pull=False)
+
+sheet_replicator = SheetReplicator(schedule_store, sheet)
+
+# 🆕 封存：把已處理完的舊資料移出試算表與熱資料表，讓同步與查詢只掃描有效資料
+SCHEDULE_ARCHIVE_DAYS = int(os.getenv("SCHEDULE_ARCHIVE_DAYS", 40))  # 需大於「本月行程」可能回溯的天數
+SCHEDULE_ARCHIVE_WORKSHEET = os.getenv("SCHEDULE_ARCHIVE_WORKSHEET")  # 同一份試算表中的封存工作表；未設定時不封存
+SCHEDULE_COMPACT_HOUR = int(os.getenv("SCHEDULE_COMPACT_HOUR", 3))
+
+class ScheduleCompactor:
+    """將超過保留期限的行程與已處理的提醒移到封存區，並一次重寫試算表"""
+
+    def __init__(self, store, replicator, archive_worksheet=None, retention_days=SCHEDULE_ARCHIVE_DAYS):
+        self.store = store
+        self.replicator = replicator
+        self.archive_worksheet = archive_worksheet
+        self.retention_days = retention_days
+        self.last_report = None
+
+    def _timed_pull(self):
+        start = time.perf_counter()
+        self.replicator.pull_changes(force=True)
+        return time.perf_counter() - start
+
+    def compact(self, now=None):
+        """執行封存，回傳報告（封存筆數、試算表列數與同步掃描時間的前後比較）"""
+        now = now or datetime.now()
+        cutoff = (now - timedelta(days=self.retention_days)).timestamp()
+        replicator = self.replicator
+        try:
+            # 重寫期間不能有其他同步，否則列號會錯亂
+            with replicator._lock:
+                replicator.push_changes()
+                scan_before = self._timed_pull()
+                with self.store.connect() as conn:
+                    rows = conn.execute(
+                        "SELECT id, date, time, content, user_id, status, due_at, synced, sheet_row, dirty FROM schedules "
+                        "WHERE sheet_row IS NOT NULL ORDER BY sheet_row"
+                    ).fetchall()
+                # 只封存已同步、沒有本地修改、且不會再發送的舊資料
+                archived_ids = {
+                    row[0] for row in rows
+                    if not row[9] and row[6] is not None and row[6] < cutoff and row[5] not in ("待發送", "發送中")
+                }
+                report = {
+                    "moved": len(archived_ids),
+                    "sheet_rows_before": len(rows),
+                    "sheet_rows_after": len(rows) - len(archived_ids),
+                    "scan_seconds_before": scan_before,
+                    "scan_seconds_after": scan_before,
+                }
+                if not archived_ids:
+                    self.last_report = report
+                    print("🗄️ 沒有需要封存的行程")
+                    return report
+
+                archived = [row for row in rows if row[0] in archived_ids]
+                kept = [row for row in rows if row[0] not in archived_ids]
+                # 先寫入本地封存表並記錄是否已寫入封存工作表：任何一步失敗後重跑都不會重複封存
+                with self.store.connect() as conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO schedule_archive (id, date, time, content, user_id, status, due_at, archived_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        [row[:7] + (now.timestamp(),) for row in archived]
+                    )
+                if self.archive_worksheet is not None:
+                    with self.store.connect() as conn:
+                        pending_ids = {
+                            row[0] for row in conn.execute(
+                                "SELECT id FROM schedule_archive WHERE sheet_archived = 0"
+                            )
+                        } & archived_ids
+                    pending = [row for row in archived if row[0] in pending_ids]
+                    if pending:
+                        replicator._call(
+                            "寫入封存工作表", self.archive_worksheet.append_rows,
+                            [json.loads(row[7]) for row in pending]
+                        )
+                        with self.store.connect() as conn:
+                            conn.executemany(
+                                "UPDATE schedule_archive SET sheet_archived = 1 WHERE id = ?",
+                                [(row[0],) for row in pending]
+                            )
+                # 單次寫回：保留的資料往上移，原本多出來的列以空白覆蓋
+                last_row = rows[-1][8]
+                values = [json.loads(row[7]) + [replicator._sheet_key(row[0])] for row in kept]
+                values += [[""] * SHEET_KEY_COLUMN for _ in range(last_row - 1 - len(values))]
+                replicator._call(
+                    "重寫試算表", lambda: replicator.worksheet.update(
+                        values=values, range_name=f"A2:F{last_row}"
+                    )
+                )
+                with self.store.connect() as conn:
+                    conn.executemany("DELETE FROM schedules WHERE id = ?", [(row[0],) for row in archived])
+                    conn.executemany(
+                        "UPDATE schedules SET sheet_row = ?, keyed = 1 WHERE id = ?",
+                        [(sheet_row, row[0]) for sheet_row, row in enumerate(kept, start=2)]
+                    )
+                    self.store._bump_version(conn)
+                # 重新掃描一次：確認重寫結果與本地一致，也量測封存後的掃描時間
+                report["scan_seconds_after"] = self._timed_pull()
+            self.last_report = report
+            print(
+                f"🗄️ 已封存 {report['moved']} 筆行程，試算表 {report['sheet_rows_before']} → "
+                f"{report['sheet_rows_after']} 列，同步掃描 {report['scan_seconds_before']:.2f}s → "
+                f"{report['scan_seconds_after']:.2f}s"
+            )
+            return report
+        except Exception as e:
+            print(f"❌ 封存行程失敗：{e}")
+            return None
+
+schedule_compactor = ScheduleCompactor(
+    schedule_store,
+    sheet_replicator,
+    worksheet_registry.handle(spreadsheet_id, SCHEDULE_ARCHIVE_WORKSHEET) if SCHEDULE_ARCHIVE_WORKSHEET else None
+)
+
+# 🆕 行程索引：每位使用者一個依時間排序的陣列，期間查詢只需二分搜尋
+class ScheduleIndex:
+    """使用者 ID → 依時間排序的 (datetime, content) 陣列"""
+
+    def __init__(self, store):
+        self.store = store
+        self._by_user = {}
+        self._user_revs = {}   # 使用者 → 資料變動次數，回覆快取據此判斷是否失效
+        self._generation = 0   # 整個重建的次數
+        self._version = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def _insert_rows(self, rows, sort):
+        for row_id, due_at, content, user_id, _ in rows:
+            self._last_id = max(self._last_id, row_id)
+            if due_at is None:
+                continue
+            key = user_id.lower()
+            self._user_revs[key] = self._user_revs.get(key, 0) + 1
+            items = self._by_user.setdefault(key, [])
+            item = (datetime.fromtimestamp(due_at), content)
+            if sort:
+                items.append(item)
+            else:
+                bisect.insort(items, item)
+
+    def _sync(self):
+        version = self.store.version()
+        if self._version != version:
+            # 試算表有人工修改時整個重建
+            self._by_user = {}
+            self._user_revs = {}
+            self._generation += 1
+            self._last_id = 0
+            self._insert_rows(self.store.rows_after(0), sort=True)
+            for items in self._by_user.values():
+                items.sort()
+            self._version = version
+        else:
+            # 只加入上次同步後新增的資料
+            self._insert_rows(self.store.rows_after(self._last_id), sort=False)
+
+    def query(self, user_id, start, end):
+        """取得使用者在 [start, end) 之間的行程"""
+        with self._lock:
+            self._sync()
+            items = self._by_user.get(user_id.lower(), [])
+            lo = bisect.bisect_left(items, (start,))
+            hi = bisect.bisect_left(items, (end,))
+            return items[lo:hi]
+
+    def revision(self, user_id):
+        """使用者資料的版本，新增該使用者的行程或整個重建後會改變"""
+        with self._lock:
+            self._sync()
+            return self._generation, self._user_revs.get(user_id.lower(), 0)
+
+schedule_index = ScheduleIndex(schedule_store)
+
+# 🆕 行程查詢回覆快取：以 (使用者, 查詢期間, 期間起點) 為鍵，
+# 使用者有新增行程、試算表被修改，或跨日、跨週使期間起點改變時自動失效
+SCHEDULE_REPLY_CACHE_SIZE = int(os.getenv("SCHEDULE_REPLY_CACHE_SIZE", 1024))
+
+class ScheduleReplyCache:
+    """已組好的行程查詢回覆，依最近使用順序保留 maxsize 筆"""
+
+    def __init__(self, index, maxsize=SCHEDULE_REPLY_CACHE_SIZE):
+        self.index = index
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, period, bucket, render):
+        """有效的快取直接回傳，否則呼叫 render() 產生回覆並存入快取"""
+        revision = self.index.revision(user_id)
+        key = (user_id.lower(), period, bucket)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == revision:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        reply = render()
+        with self._lock:
+            self._entries[key] = (revision, reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return reply
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+schedule_reply_cache = ScheduleReplyCache(schedule_index)
+
+# 🆕 下週行程摘要：新增行程時就更新並組好訊息，週日 22:00 的排程只需要發送
+def next_week_range(now):
+    """回傳下週一 00:00 到下下週一 00:00（今天是週一時取下週一）"""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today + timedelta(days=(7 - now.weekday()) % 7 or 7)
+    return start, start + timedelta(days=7)
+
+class WeeklyDigest:
+    """下週行程的物化檢視：依時間排序的行程與組好的週報訊息"""
+
+    def __init__(self, store):
+        self.store = store
+        self._entries = []
+        self._by_user = {}
+        self._message = None
+        self._range = None
+        self._version = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def _insert_rows(self, rows, sort):
+        start, end = self._range
+        for row_id, due_at, content, user_id, _ in rows:
+            self._last_id = max(self._last_id, row_id)
+            if due_at is None:
+                continue
+            dt = datetime.fromtimestamp(due_at)
+            if not start <= dt < end:
+                continue
+            self._message = None
+            if sort:
+                self._entries.append((dt, content, user_id))
+                self._by_user.setdefault(user_id.lower(), []).append((dt, content))
+            else:
+                bisect.insort(self._entries, (dt, content, user_id))
+                bisect.insort(self._by_user.setdefault(user_id.lower(), []), (dt, content))
+
+    def _render(self):
+        start, end = self._range
+        lines = [
+            "📅 下週行程預覽",
+            f"🗓️ {start.strftime('%m/%d')} - {(end - timedelta(days=1)).strftime('%m/%d')}",
+            "━━━━━━━━━━━━━━━━",
+            "",
+        ]
+        if not self._entries:
+            lines += ["🎉 太棒了！下週沒有安排任何行程", "✨ 可以好好放鬆，享受自由時光！"]
+            return "\n".join(lines)
+        weekday_names = ["一", "二", "三", "四", "五", "六", "日"]
+        current_date = None
+        for dt, content, _ in self._entries:
+            # 如果是新的日期，加上日期標題
+            if current_date != dt.date():
+                current_date = dt.date()
+                lines += ["", f"📆 {dt.strftime('%m/%d')} (週{weekday_names[dt.weekday()]})", "─────────────────────"]
+            lines.append(f"🕐 {dt.strftime('%H:%M')} │ {content}")
+        lines += ["", "💡 記得提前準備，祝您一週順利！"]
+        return "\n".join(lines)
+
+    def refresh(self, now=None):
+        """併入新增的行程並重新組好訊息；跨週或試算表被人工修改時整個重建"""
+        week = next_week_range(now or datetime.now())
+        with self._lock:
+            version = self.store.version()
+            if self._range != week or self._version != version:
+                self._range, self._version = week, version
+                self._entries, self._by_user, self._last_id = [], {}, 0
+                self._insert_rows(self.store.rows_after(0), sort=True)
+                self._entries.sort()
+                for items in self._by_user.values():
+                    items.sort()
+                self._message = None
+            else:
+                self._insert_rows(self.store.rows_after(self._last_id), sort=False)
+            if self._message is None:
+                self._message = self._render()
+
+    def message(self, now=None):
+        """取得下週行程預覽訊息"""
+        self.refresh(now)
+        return self._message
+
+    def user_count(self):
+        return len(self._by_user)
+
+    def query(self, user_id, now=None):
+        """取得使用者下週的行程（datetime, content）"""
+        self.refresh(now)
+        with self._lock:
+            return list(self._by_user.get(user_id.lower(), []))
+
+weekly_digest = WeeklyDigest(schedule_store)
 
 # 設定要發送推播的群組 ID
 TARGET_GROUP_ID = os.getenv("MORNING_GROUP_ID", "C4e138aa0eb252daa89846daab0102e41")
@@ -41,22 +1338,292 @@ RANKING_SPREADSHEET_ID = "1LkPCLbaw5wmPao9g2mMEMRT7eklteR-6RLaJNYP8OQA"
 WORKSHEET_NAME = "工作表2"
 ranking_data = {}  # 風雲榜資料暫存
 
+# 🆕 風雲榜寫入緩衝：短時間內的多筆提交合併成一次 append_rows，並先存入本地資料庫避免遺失
+RANKING_FLUSH_WINDOW = float(os.getenv("RANKING_FLUSH_WINDOW", 2))
+RANKING_FLUSH_ROWS = int(os.getenv("RANKING_FLUSH_ROWS", 50))
+RANKING_CONFIRM_TIMEOUT = float(os.getenv("RANKING_CONFIRM_TIMEOUT", 30))
+RANKING_ORPHAN_AGE = 60  # 超過此秒數仍未寫入的資料視為其他行程遺留，由本行程接手
+RANKING_FLUSH_RETRIES = int(os.getenv("RANKING_FLUSH_RETRIES", 5))  # 寫入失敗（例如 429/5xx）的重試次數上限
+RANKING_RETRY_MAX_DELAY = 60
+
+class RankingWriteBuffer:
+    """風雲榜資料的 write-behind 緩衝區"""
+
+    def __init__(self, worksheet, window=RANKING_FLUSH_WINDOW, max_rows=RANKING_FLUSH_ROWS, connect=db_connect):
+        self.worksheet = worksheet
+        self.window = window
+        self.max_rows = max_rows
+        self.connect = connect
+        self.flush_count = 0
+        self._futures = {}
+        self._pending_rows = 0
+        self._first_at = None
+        self._thread = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # 取消提交時等待進行中的寫入結束
+        with self.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ranking_buffer ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, batch_id TEXT NOT NULL, owner TEXT NOT NULL, "
+                "row TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            # 舊版資料表補上寫入失敗次數欄位
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(ranking_buffer)")}
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE ranking_buffer ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ranking-flusher", daemon=True)
+            self._thread.start()
+
+    def submit(self, rows):
+        """加入緩衝區，回傳 Future：包含這些資料的寫入成功時結果為 True"""
+        batch_id = uuid.uuid4().hex
+        now = time.time()
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT INTO ranking_buffer (batch_id, owner, row, created_at) VALUES (?, ?, ?, ?)",
+                [(batch_id, PROCESS_ID, json.dumps(row, ensure_ascii=False), now) for row in rows]
+            )
+        future = Future()
+        future.batch_id = batch_id
+        with self._cond:
+            self._futures[batch_id] = future
+            self._pending_rows += len(rows)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            self._ensure_thread()
+            self._cond.notify()
+        return future
+
+    def wait(self, future, timeout=RANKING_CONFIRM_TIMEOUT):
+        """等待寫入結果；逾時就取消這筆提交，使用者沒收到確認而重新提交時資料不會重複"""
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return self.cancel(future)
+
+    def cancel(self, future):
+        """取消尚未寫入的提交，回傳這筆提交是否已經寫入"""
+        with self._flush_lock:
+            with self._cond:
+                if future.done():
+                    return future.result()
+                self._futures.pop(future.batch_id, None)
+                future.set_result(False)
+            with self.connect() as conn:
+                conn.execute("DELETE FROM ranking_buffer WHERE batch_id = ?", (future.batch_id,))
+        print("⚠️ 風雲榜資料等待寫入逾時，已取消該筆提交")
+        return False
+
+    def recover(self):
+        """接手上次當機或其他行程遺留、尚未寫入的資料"""
+        with self.connect() as conn:
+            recovered = conn.execute(
+                "UPDATE ranking_buffer SET owner = ? WHERE owner = ? OR created_at < ?",
+                (PROCESS_ID, PROCESS_ID, time.time() - RANKING_ORPHAN_AGE)
+            ).rowcount
+        if recovered:
+            print(f"📥 發現 {recovered} 筆尚未寫入工作表2的風雲榜資料")
+            with self._cond:
+                self._pending_rows += recovered
+                if self._first_at is None:
+                    self._first_at = time.monotonic()
+                self._ensure_thread()
+                self._cond.notify()
+
+    def _run(self):
+        failures = 0
+        while True:
+            with self._cond:
+                while not self._pending_rows:
+                    self._cond.wait()
+                # 等到時間窗結束或累積足夠筆數
+                while self._pending_rows < self.max_rows:
+                    remaining = self._first_at + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._pending_rows = 0
+                self._first_at = None
+            remaining = self.flush()
+            if not remaining:
+                failures = 0
+                continue
+            # 寫入失敗的資料留在資料庫，指數退避後重試
+            failures += 1
+            time.sleep(min(2 ** failures, RANKING_RETRY_MAX_DELAY))
+            with self._cond:
+                self._pending_rows += remaining
+                if self._first_at is None:
+                    self._first_at = time.monotonic() - self.window
+
+    def flush(self):
+        """寫入緩衝區的資料，回傳寫入失敗、留待重試的列數"""
+        with self._flush_lock:
+            with self.connect() as conn:
+                records = conn.execute(
+                    "SELECT id, batch_id, row FROM ranking_buffer WHERE owner = ? ORDER BY id",
+                    (PROCESS_ID,)
+                ).fetchall()
+            if not records:
+                return 0
+            batch_ids = {batch_id for _, batch_id, _ in records}
+            try:
+                self.worksheet.append_rows([json.loads(row) for _, _, row in records])
+            except Exception as e:
+                return self._flush_failed(records, e)
+            self.flush_count += 1
+            print(f"✅ 已將 {len(batch_ids)} 筆提交共 {len(records)} 列寫入工作表2")
+            with self.connect() as conn:
+                conn.executemany("DELETE FROM ranking_buffer WHERE id = ?", [(row_id,) for row_id, _, _ in records])
+            self._resolve(batch_ids, True)
+            return 0
+
+    def _flush_failed(self, records, error):
+        """記錄失敗次數；超過重試上限的提交放棄寫入並通知等待中的使用者，回傳留待重試的列數"""
+        with self.connect() as conn:
+            conn.executemany(
+                "UPDATE ranking_buffer SET attempts = attempts + 1 WHERE id = ?",
+                [(row_id,) for row_id, _, _ in records]
+            )
+            dropped = {
+                row[0] for row in conn.execute(
+                    "SELECT DISTINCT batch_id FROM ranking_buffer WHERE owner = ? AND attempts >= ?",
+                    (PROCESS_ID, RANKING_FLUSH_RETRIES)
+                )
+            }
+            conn.executemany("DELETE FROM ranking_buffer WHERE batch_id = ?", [(batch_id,) for batch_id in dropped])
+        if dropped:
+            print(f"❌ 寫入工作表2失敗 {RANKING_FLUSH_RETRIES} 次，放棄 {len(dropped)} 筆提交：{error}")
+        else:
+            print(f"❌ 寫入工作表2失敗，稍後重試：{error}")
+        self._resolve(dropped, False)
+        return sum(1 for _, batch_id, _ in records if batch_id not in dropped)
+
+    def _resolve(self, batch_ids, success):
+        with self._cond:
+            for batch_id in batch_ids:
+                future = self._futures.pop(batch_id, None)
+                if future:
+                    future.set_result(success)
+
 # 🆕 抽籤功能 - 抽籤名單
 LOTTERY_NAMES = ["奕君", "小嫺", "嘉憶", "惠華"]
 
+# 🆕 Webhook 非同步處理：/callback 驗證簽章後放入佇列立即回應，由工作執行緒處理事件
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 20))
+
+class WebhookQueue:
+    """有上限的 webhook 事件佇列"""
+
+    def __init__(self, handler, workers=WEBHOOK_WORKERS, maxsize=WEBHOOK_QUEUE_SIZE):
+        self.handler = handler
+        self.workers = workers
+        self.processed_count = 0
+        self.inline_count = 0     # 佇列已滿、改在請求執行緒中直接處理的次數
+        self.max_depth = 0
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._accepting = True
+        self._lock = threading.Lock()
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"webhook-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _process(self, body, signature):
+        try:
+            with WEBHOOK_EVENT_SECONDS.time():
+                self.handler.handle(body, signature)
+        except Exception as e:
+            print(f"❌ 處理 webhook 事件失敗：{e}")
+        with self._lock:
+            self.processed_count += 1
+
+    def _worker(self):
+        while True:
+            body, signature = self._queue.get()
+            self._process(body, signature)
+            self._queue.task_done()
+
+    def submit(self, body, signature):
+        """放入佇列；佇列已滿或正在關閉時直接處理，避免事件遺失"""
+        if self._accepting:
+            self._ensure_workers()
+            try:
+                self._queue.put_nowait((body, signature))
+                self.max_depth = max(self.max_depth, self._queue.qsize())
+                return
+            except queue.Full:
+                print("⚠️ Webhook 佇列已滿，改為直接處理")
+        with self._lock:
+            self.inline_count += 1
+        self._process(body, signature)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def drain(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        """停止接收新事件，並等待佇列中的事件處理完畢"""
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if self._queue.unfinished_tasks:
+            print(f"⚠️ 關閉時仍有 {self._queue.unfinished_tasks} 筆 webhook 事件未處理")
+
+webhook_queue = WebhookQueue(handler)
+
 @app.route("/")
 def home():
     return "LINE Reminder Bot is running."
 
 @app.route("/callback", methods=["POST"])
 def callback():
-    signature = request.headers.get("X-Line-Signature")
-    body = request.get_data(as_text=True)
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        abort(400)
-    return "OK"
+    with WEBHOOK_REQUEST_SECONDS.time():
+        signature = request.headers.get("X-Line-Signature")
+        body = request.get_data(as_text=True)
+        if not signature or not handler.parser.signature_validator.validate(body, signature):
+            abort(400)
+        webhook_queue.submit(body, signature)
+        return "OK"
+
+# 🆕 既有的統計數字直接以 callback 提供，抓取時才讀取
+Gauge("linebot_queue_depth", "Items waiting in in-process queues", callback=lambda: [
+    ({"queue": "webhook"}, webhook_queue.queue_depth()),
+    ({"queue": "push"}, push_dispatcher.queue_depth()),
+    ({"queue": "reminder"}, len(reminder_queue)),
+])
+Counter("linebot_webhook_processed_total", "Webhook bodies handled", callback=lambda: webhook_queue.processed_count)
+Counter("linebot_webhook_inline_total", "Webhook bodies handled inline because the queue was full",
+        callback=lambda: webhook_queue.inline_count)
+Counter("linebot_sheet_conflicts_total", "Rows edited both locally and in the sheet",
+        callback=lambda: sheet_replicator.conflict_count)
+Counter("linebot_ranking_flushes_total", "Batched ranking sheet writes", callback=lambda: ranking_buffer.flush_count)
+Counter("linebot_cache_hits_total", "Cache hits by cache", callback=lambda: [
+    ({"cache": "sheet_datetime"}, sheet_datetime_cache_stats()["hits"]),
+    ({"cache": "schedule_reply"}, schedule_reply_cache.stats()["hits"]),
+])
+Counter("linebot_cache_misses_total", "Cache misses by cache", callback=lambda: [
+    ({"cache": "sheet_datetime"}, sheet_datetime_cache_stats()["misses"]),
+    ({"cache": "schedule_reply"}, schedule_reply_cache.stats()["misses"]),
+])
+Gauge("linebot_leader", "1 if this process runs the scheduled jobs", callback=lambda: int(leader_elector.is_leader))
+
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+ranking_buffer = RankingWriteBuffer(worksheet_registry.handle(RANKING_SPREADSHEET_ID, WORKSHEET_NAME))
 
 # 🆕 抽籤功能
 def process_lottery(command):
@@ -84,74 +1651,348 @@ def process_lottery(command):
         print(f"❌ 抽籤處理失敗：{e}")
         return "抽籤系統發生錯誤"
 
-# 🆕 新增：檢查並發送待發送的行程提醒
+# 🆕 待發送提醒佇列：依發送時間排序的常駐 min-heap，避免掃描整張工作表
+class ReminderQueue:
+    """依發送時間排序的待發送提醒佇列"""
+
+    def __init__(self, store):
+        self.store = store
+        self._heap = []
+        self._lock = threading.Lock()
+        self._version = None
+        self._last_id = 0
+        self._hold_until = None  # 放回佇列的提醒在此之前不重試
+
+    def ensure_loaded(self):
+        """資料庫被同步修改時重建佇列，否則只加入新增的提醒"""
+        try:
+            self._load()
+        except Exception:
+            # 資料庫暫時無法讀取：已到期的提醒在重試間隔內不再喚醒計時執行緒，避免不斷重試
+            self.hold()
+            raise
+
+    def _load(self):
+        version = self.store.version()
+        with self._lock:
+            if self._version != version:
+                rows = self.store.pending_reminders()
+                self._heap = []
+                self._version = version
+                self._last_id = 0
+            else:
+                rows = self.store.pending_reminders(after_id=self._last_id)
+            for row_id, due_at, content, user_id in rows:
+                self._last_id = max(self._last_id, row_id)
+                heapq.heappush(self._heap, (datetime.fromtimestamp(due_at), row_id, content, user_id))
+            # 發送途中當機的提醒在租約過期後重新排入（重複的項目會在取得發送權時被過濾）
+            for row_id, due_at, content, user_id in self.store.expired_claims():
+                heapq.heappush(self._heap, (datetime.fromtimestamp(due_at), row_id, content, user_id))
+
+    def next_due(self):
+        with self._lock:
+            if not self._heap:
+                return None
+            if self._hold_until and self._hold_until > self._heap[0][0]:
+                return self._hold_until
+            return self._heap[0][0]
+
+    def hold(self, delay=None):
+        """delay 秒內不處理佇列中的提醒（下次 pop_due() 時解除）"""
+        delay = REMINDER_RETRY_SECONDS if delay is None else delay
+        with self._lock:
+            self._hold_until = datetime.now() + timedelta(seconds=delay)
+
+    def requeue(self, items, delay=None):
+        """把已取出但尚未處理的提醒放回佇列，delay 秒內不再重試"""
+        with self._lock:
+            for item in items:
+                heapq.heappush(self._heap, item)
+        self.hold(delay)
+
+    def clear(self):
+        """清空佇列（非 leader 不發送提醒），下次 ensure_loaded() 時從資料庫重新載入"""
+        with self._lock:
+            self._heap = []
+            self._version = None
+            self._last_id = 0
+            self._hold_until = None
+
+    def pop_due(self, now, catchup=None):
+        """取出所有已到發送時間的提醒，回傳 (待發送, 已超過補發時限)"""
+        catchup = timedelta(minutes=REMINDER_CATCHUP_MINUTES) if catchup is None else catchup
+        due_items, expired_items = [], []
+        with self._lock:
+            self._hold_until = None
+            while self._heap and self._heap[0][0] <= now:
+                item = heapq.heappop(self._heap)
+                if now - item[0] <= catchup:
+                    due_items.append(item)
+                else:
+                    expired_items.append(item)
+        return due_items, expired_items
+
+    def __len__(self):
+        return len(self._heap)
+
+reminder_queue = ReminderQueue(schedule_store)
+
+# 🆕 精準提醒：計時執行緒睡到下一筆提醒的發送時間才醒來，佇列為空時完全不喚醒
+# 停機等原因錯過的提醒，在 REMINDER_CATCHUP_MINUTES 內補發，超過則標記為已過期
+REMINDER_CATCHUP_MINUTES = int(os.getenv("REMINDER_CATCHUP_MINUTES", 30))
+REMINDER_SWEEP_INTERVAL = int(os.getenv("REMINDER_SWEEP_INTERVAL", 60))
+REMINDER_RETRY_SECONDS = int(os.getenv("REMINDER_RETRY_SECONDS", 5))  # 資料庫暫時無法寫入時的重試間隔
+
+class ReminderTimer:
+    """依提醒佇列的最早發送時間喚醒並發送提醒"""
+
+    def __init__(self, reminder_queue, send):
+        self.queue = reminder_queue
+        self.send = send
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def notify(self):
+        """佇列有新提醒時呼叫，讓計時執行緒重新計算下次喚醒時間"""
+        with self._cond:
+            self._cond.notify()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reminder-timer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                next_due = self.queue.next_due()
+                if next_due is None:
+                    self._cond.wait()
+                    continue
+                delay = (next_due - datetime.now()).total_seconds()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                if not leader_elector.is_leader:
+                    # 非 leader 不發送也不保留佇列，成為 leader 時會重新載入並喚醒計時執行緒
+                    self.queue.clear()
+                    continue
+            self.send()
+
+# 🆕 新增：檢查並發送待發送的行程提醒（由 reminder_timer 在發送時間準時呼叫，也可手動執行）
+# 🆕 發送規劃：同一批到期的提醒，同一位收件者合併成一次推播（最多 LINE_MAX_MESSAGES 則），
+# 內容完全相同的多位使用者改用 multicast；群組與聊天室（C、R 開頭）不支援 multicast，個別推播
+def plan_reminder_deliveries(items):
+    """items 為 (row_id, content, user_id)，回傳 [(方式, 收件者, 訊息內容, row_ids)]"""
+    by_recipient = {}
+    for row_id, content, user_id in items:
+        by_recipient.setdefault(user_id, []).append((row_id, content))
+    deliveries = []
+    shared = {}  # 訊息內容 → [(使用者, row_ids)]
+    for user_id, reminders in by_recipient.items():
+        for start in range(0, len(reminders), LINE_MAX_MESSAGES):
+            chunk = reminders[start:start + LINE_MAX_MESSAGES]
+            contents = tuple(content for _, content in chunk)
+            row_ids = [row_id for row_id, _ in chunk]
+            if user_id.startswith("U"):
+                shared.setdefault(contents, []).append((user_id, row_ids))
+            else:
+                deliveries.append(("push", user_id, contents, row_ids))
+    for contents, recipients in shared.items():
+        if len(recipients) == 1:
+            user_id, row_ids = recipients[0]
+            deliveries.append(("push", user_id, contents, row_ids))
+            continue
+        for start in range(0, len(recipients), LINE_MULTICAST_MAX):
+            batch = recipients[start:start + LINE_MULTICAST_MAX]
+            deliveries.append((
+                "multicast",
+                [user_id for user_id, _ in batch],
+                contents,
+                [row_id for _, row_ids in batch for row_id in row_ids]
+            ))
+    return deliveries
+
+def wait_for_delivery(future, row_ids):
+    """等待推播結果；派送佇列壅塞時定期延長 row_ids 的租約，
+    避免推播還沒送出租約就過期，被其他行程或手動檢查重新取得而重送"""
+    while True:
+        try:
+            return future.result(timeout=REMINDER_LEASE_SECONDS / 3)
+        except FutureTimeoutError:
+            try:
+                schedule_store.renew(row_ids)
+            except Exception as e:
+                print(f"⚠️ 延長提醒租約失敗：{e}")
+
 def check_and_send_pending_reminders():
     """檢查並發送待發送的行程提醒"""
+    with JOB_DURATION_SECONDS.time(job="reminder_check"):
+        _check_and_send_pending_reminders()
+
+def _check_and_send_pending_reminders():
     try:
         print("🔍 檢查待發送的行程提醒...")
         
-        all_rows = sheet.get_all_values()
-        if len(all_rows) <= 1:
-            return
-            
+        reminder_queue.ensure_loaded()
         now = datetime.now()
         sent_count = 0
         
-        # 從第2行開始檢查（跳過標題行）
-        for i, row in enumerate(all_rows[1:], start=2):
-            if len(row) < 5:
-                continue
-                
+        due_items, expired_items = reminder_queue.pop_due(now)
+        
+        # 超過補發時限的提醒不再發送，標記為已過期
+        for k, (schedule_dt, i, content, user_id) in enumerate(expired_items):
             try:
-                date_str, time_str, content, user_id, status = row[:5]
-                
-                # 只處理標記為 "待發送" 的行程
-                if status != "待發送":
-                    continue
-                    
-                # 解析行程時間
-                schedule_dt = datetime.strptime(f"{date_str} {time_str}", "%Y/%m/%d %H:%M")
-                
-                # 檢查是否到了發送時間（前後2分鐘內）
-                time_diff = abs((now - schedule_dt).total_seconds())
+                if schedule_store.claim(i):
+                    schedule_store.confirm(i, f"已過期 {now.strftime('%H:%M')}")
+                    print(f"⌛ 提醒已超過補發時限: {content} ({schedule_dt.strftime('%Y/%m/%d %H:%M')})")
+            except Exception as e:
+                # 資料庫暫時無法寫入：尚未處理的提醒放回佇列稍後再試
+                print(f"❌ 標記過期提醒失敗，稍後重試：{e}")
+                reminder_queue.requeue(expired_items[k:])
+                break
+        
+        # 先取得發送權，其他行程或手動檢查已在處理的提醒直接略過
+        claimed = []
+        for k, (schedule_dt, i, content, user_id) in enumerate(due_items):
+            try:
+                if schedule_store.claim(i):
+                    claimed.append((i, content, user_id))
+            except Exception as e:
+                # 已取得發送權的照常發送，其餘放回佇列稍後再試
+                print(f"❌ 取得提醒發送權失敗，稍後重試：{e}")
+                reminder_queue.requeue(due_items[k:])
+                break
+        due_times = {i: schedule_dt for schedule_dt, i, _, _ in due_items}
+        
+        # 已到時間的提醒依發送規劃合併後，全部交給推播派送器並行發送
+        pending = []
+        for method, to, contents, row_ids in plan_reminder_deliveries(claimed):
+            print(f"📤 發送 {len(row_ids)} 則提醒給 {to if method == 'push' else f'{len(to)} 位使用者'}")
+            # retry key 由資料庫識別碼與資料列決定，當機後重送也不會讓使用者收到兩次
+            retry_key = schedule_store.retry_key(row_ids)
+            messages = [TextSendMessage(text=content) for content in contents]
+            send = push_dispatcher.multicast if method == "multicast" else push_dispatcher.push
+            pending.append((row_ids, contents, send(to, messages, retry_key=retry_key)))
+        
+        for n, (row_ids, contents, future) in enumerate(pending):
+            try:
+                # 等待期間延長這一筆與之後所有尚未完成的推播的租約
+                wait_for_delivery(future, [i for ids, _, _ in pending[n:] for i in ids])
                 
-                if time_diff <= 120:  # 2分鐘內
-                    print(f"📤 發送提醒: {content} 給 {user_id}")
-                    
-                    try:
-                        # 發送推播
-                        line_bot_api.push_message(user_id, TextSendMessage(text=content))
-                        
-                        # 🎯 重點：只有推播成功才更新狀態
-                        sheet.update_cell(i, 5, f"已發送 {now.strftime('%H:%M')}")
+                # 🎯 重點：只有推播成功才更新狀態，每一列提醒各自記錄
+                sent_at = datetime.now()
+                for i in row_ids:
+                    REMINDER_LAG_SECONDS.observe((sent_at - due_times[i]).total_seconds())
+                    if schedule_store.confirm(i, f"已發送 {now.strftime('%H:%M')}"):
                         sent_count += 1
-                        print(f"✅ 提醒已發送並更新狀態: {content}")
-                        
-                    except Exception as push_error:
-                        print(f"❌ 推播失敗: {push_error}")
-                        # 推播失敗時標記為失敗，不標記為已發送
-                        sheet.update_cell(i, 5, f"發送失敗 {now.strftime('%H:%M')}")
-                        
-            except Exception as row_error:
-                print(f"❌ 處理第{i}行資料失敗: {row_error}")
-                continue
+                print(f"✅ 提醒已發送並更新狀態: {'、'.join(contents)}")
+                
+            except Exception as push_error:
+                print(f"❌ 推播失敗: {push_error}")
+                # 推播失敗時標記為失敗，不標記為已發送
+                for i in row_ids:
+                    schedule_store.confirm(i, f"發送失敗 {now.strftime('%H:%M')}")
         
         if sent_count > 0:
             print(f"📊 行程提醒檢查完成: 成功發送 {sent_count} 項")
             
     except Exception as e:
         print(f"❌ 檢查待發送行程提醒失敗：{e}")
+    finally:
+        # 本次檢查的所有狀態變更一次寫回試算表。只有 leader 會寫入試算表（replicator 的鎖只在單一行程內有效，
+        # 多個行程同時 append 會重複寫入）；非 leader 的變更留在資料庫，由 leader 的 sheet_sync 工作同步。
+        # 寫回交給背景執行緒，計時執行緒不等待試算表 API，下一筆提醒才能準時發送
+        if leader_elector.is_leader:
+            sheet_replicator.request_push()
+        else:
+            # 非 leader 手動檢查時載入的佇列不保留，提醒由 leader 發送
+            reminder_queue.clear()
+
+reminder_timer = ReminderTimer(reminder_queue, check_and_send_pending_reminders)
+
+def sweep_pending_reminders():
+    """將其他行程新增或從試算表同步來的提醒載入佇列（只查詢本地資料庫）"""
+    reminder_queue.ensure_loaded()
+    reminder_timer.notify()
+
+# 🆕 跨行程喚醒：leader 綁定 Unix datagram socket，其他 worker 新增提醒後送出一個封包，
+# leader 立即載入新提醒並重新計算喚醒時間，不必等 REMINDER_SWEEP_INTERVAL 的定期掃描
+REMINDER_WAKE_SOCKET = os.getenv("REMINDER_WAKE_SOCKET", f"{BOT_DB_PATH}.wake.sock")
+
+class ReminderWakeChannel:
+    """同一台主機上行程之間的喚醒通道；無法使用 Unix socket 時只靠定期掃描"""
+
+    def __init__(self, path=REMINDER_WAKE_SOCKET):
+        self.path = path
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def listen(self, callback):
+        """綁定通道（取代其他行程先前的綁定），收到封包時呼叫 callback"""
+        if not hasattr(socket, "AF_UNIX"):
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            sock.bind(self.path)
+        except OSError as e:
+            sock.close()
+            print(f"⚠️ 無法建立提醒喚醒通道，其他 worker 新增的提醒會在定期掃描時載入：{e}")
+            return
+        self.close()
+        with self._lock:
+            self._sock = sock
+        threading.Thread(target=self._run, args=(sock, callback), name="reminder-wake", daemon=True).start()
+
+    def _run(self, sock, callback):
+        while True:
+            try:
+                if not sock.recv(64):
+                    return  # 通道已關閉
+            except OSError:
+                return
+            try:
+                callback()
+            except Exception as e:
+                print(f"❌ 處理提醒喚醒失敗：{e}")
+
+    def close(self):
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+
+    def notify(self):
+        """通知 leader 有新提醒；沒有行程在聽時直接略過，定期掃描仍會載入"""
+        if not hasattr(socket, "AF_UNIX"):
+            return
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.sendto(b"1", self.path)
+        except OSError:
+            pass
+
+reminder_wake = ReminderWakeChannel()
+
+def wake_reminder_timer():
+    """其他行程新增提醒時由喚醒通道呼叫"""
+    if leader_elector.is_leader:
+        sweep_pending_reminders()
+
+def sync_sheet():
+    """同步試算表；從試算表合併進來的提醒立即排入佇列"""
+    version = schedule_store.version()
+    sheet_replicator.sync()
+    if schedule_store.version() != version:
+        sweep_pending_reminders()
 
 # 風雲榜功能函數
 def get_worksheet2():
-    """取得工作表2的連線"""
-    try:
-        spreadsheet = gc.open_by_key(RANKING_SPREADSHEET_ID)
-        worksheet = spreadsheet.worksheet(WORKSHEET_NAME)
-        return worksheet
-    except Exception as e:
-        print(f"❌ 連接工作表2失敗：{e}")
-        return None
+    """取得工作表2的連線（實際開啟與重新連線由 worksheet_registry 處理）"""
+    return worksheet_registry.handle(RANKING_SPREADSHEET_ID, WORKSHEET_NAME)
 
 def is_valid_ranking_format(text):
     """檢查是否為有效的風雲榜格式"""
@@ -254,10 +2095,6 @@ def process_batch_ranking_data(user_id, lines):
 def write_ranking_to_sheet_batch(user_id, data_batch):
     """將批量風雲榜資料寫入Google Sheets工作表2"""
     try:
-        worksheet = get_worksheet2()
-        if not worksheet:
-            return None
-        
         # 解析同學姓名（可能有多個，用逗號分隔）
         student_names_str = data_batch["data"][0]
         student_names = [name.strip() for name in student_names_str.split(",") if name.strip()]
@@ -284,8 +2121,9 @@ def write_ranking_to_sheet_batch(user_id, data_batch):
             row_data = [student_name] + common_data  # A欄放單個姓名，B~J欄放共用資料
             rows_to_add.append(row_data)
         
-        # 批量寫入多行資料
-        worksheet.append_rows(rows_to_add)
+        # 交給寫入緩衝區，與其他同時送出的資料合併寫入；寫入成功後才回覆
+        if not ranking_buffer.wait(ranking_buffer.submit(rows_to_add)):
+            return None
         
         # 只返回簡單的成功訊息
         return "✅ 已成功寫入工作表2"
@@ -348,17 +2186,68 @@ def send_morning_message():
     try:
         if TARGET_GROUP_ID != "C4e138aa0eb252daa89846daab0102e41":
             message = "🌅 早安！新的一天開始了 ✨\n\n願你今天充滿活力與美好！"
-            line_bot_api.push_message(TARGET_GROUP_ID, TextSendMessage(text=message))
+            push_dispatcher.push(TARGET_GROUP_ID, TextSendMessage(text=message)).result()
             print(f"✅ 早安訊息已發送到群組: {TARGET_GROUP_ID}")
         else:
             print("⚠️ 推播群組 ID 尚未設定")
     except Exception as e:
         print(f"❌ 發送早安訊息失敗：{e}")
 
+# 🆕 倒數計時：先寫入本地資料庫再排程，重啟後可由 restore_countdowns() 接續
+def start_countdown(user_id, minutes):
+    run_at = datetime.now() + timedelta(minutes=minutes)
+    countdown_id = f"countdown_{minutes}_{user_id}_{datetime.now().timestamp()}"
+    with db_connect() as conn:
+        conn.execute(
+            "INSERT INTO countdowns (id, user_id, minutes, run_at) VALUES (?, ?, ?, ?)",
+            (countdown_id, user_id, minutes, run_at.timestamp())
+        )
+    ensure_scheduler_started()
+    scheduler.add_job(
+        send_countdown_reminder,
+        trigger="date",
+        run_date=run_at,
+        args=[user_id, minutes, countdown_id],
+        id=countdown_id
+    )
+
+COUNTDOWN_RESTORE_INTERVAL = int(os.getenv("COUNTDOWN_RESTORE_INTERVAL", 60))
+
+def restore_countdowns():
+    """重新排程重啟前尚未完成的倒數計時，超過寬限時間的直接捨棄"""
+    now = datetime.now()
+    with db_connect() as conn:
+        rows = conn.execute("SELECT id, user_id, minutes, run_at FROM countdowns").fetchall()
+        expired = {row[0] for row in rows if row[3] < now.timestamp() - SCHEDULER_MISFIRE_GRACE}
+        conn.executemany("DELETE FROM countdowns WHERE id = ?", [(countdown_id,) for countdown_id in expired])
+    restored = 0
+    for countdown_id, user_id, minutes, run_at in rows:
+        # 已在本行程排程的倒數不必重複加入
+        if countdown_id in expired or scheduler.get_job(countdown_id):
+            continue
+        ensure_scheduler_started()
+        scheduler.add_job(
+            send_countdown_reminder,
+            trigger="date",
+            run_date=max(datetime.fromtimestamp(run_at), now),
+            args=[user_id, minutes, countdown_id],
+            id=countdown_id,
+            replace_existing=True
+        )
+        restored += 1
+    if restored or expired:
+        print(f"⏰ 已恢復 {restored} 個倒數計時，捨棄 {len(expired)} 個過期倒數")
+
 # 延遲後推播倒數訊息
-def send_countdown_reminder(user_id, minutes):
+def send_countdown_reminder(user_id, minutes, countdown_id=None):
     try:
-        line_bot_api.push_message(user_id, TextSendMessage(text=f"⏰ 時間到！{minutes}分鐘倒數計時結束"))
+        if countdown_id:
+            # 刪除成功才發送，避免同一個倒數被重複推播
+            with db_connect() as conn:
+                claimed = conn.execute("DELETE FROM countdowns WHERE id = ?", (countdown_id,)).rowcount
+            if not claimed:
+                return
+        push_dispatcher.push(user_id, TextSendMessage(text=f"⏰ 時間到！{minutes}分鐘倒數計時結束")).result()
         print(f"✅ {minutes}分鐘倒數提醒已發送給：{user_id}")
     except Exception as e:
         print(f"❌ 推播{minutes}分鐘倒數提醒失敗：{e}")
@@ -431,8 +2320,8 @@ def send_help_message():
         "═══════════════\n"
         "🌅 每天早上 8:30 - 溫馨早安訊息\n"
         "📅 每週日晚上 22:00 - 下週行程摘要\n"
-        "⏰ 每分鐘檢查 - 自動行程提醒推播\n\n"
-        "💡 小提醒：系統會在行程前一小時自動提醒您！"
+        "⏰ 準時推播 - 自動行程提醒\n\n"
+        f"💡 小提醒：系統會在行程前{'、'.join(label for _, label in REMINDER_LEAD_TIMES)}自動提醒您！"
     )
 
 # 美化的週報推播
@@ -444,79 +2333,13 @@ def weekly_summary():
             print("⚠️ 週報群組 ID 尚未設定，跳過週報推播")
             return
             
-        all_rows = sheet.get_all_values()[1:]
-        now = datetime.now()
-        
-        # 計算下週一到下週日的範圍
-        days_until_next_monday = (7 - now.weekday()) % 7
-        if days_until_next_monday == 0:  # 如果今天是週一
-            days_until_next_monday = 7   # 取下週一
-            
-        start = now + timedelta(days=days_until_next_monday)
-        end = start + timedelta(days=6)
-        start = start.replace(hour=0, minute=0, second=0, microsecond=0)
-        end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        print(f"📊 查詢時間範圍：{start.strftime('%Y/%m/%d %H:%M')} 到 {end.strftime('%Y/%m/%d %H:%M')}")
-        
-        user_schedules = {}
-
-        for row in all_rows:
-            if len(row) < 5:
-                continue
-            try:
-                date_str, time_str, content, user_id, _ = row
-                dt = datetime.strptime(f"{date_str} {time_str}", "%Y/%m/%d %H:%M")
-                if start <= dt <= end:
-                    user_schedules.setdefault(user_id, []).append((dt, content))
-            except Exception as e:
-                print(f"❌ 處理行程資料失敗：{e}")
-                continue
-
-        print(f"📈 找到 {len(user_schedules)} 位使用者有下週行程")
-        
-        if not user_schedules:
-            # 如果沒有行程，也發送提醒
-            message = (
-                f"📅 下週行程預覽\n"
-                f"🗓️ {start.strftime('%m/%d')} - {end.strftime('%m/%d')}\n"
-                f"━━━━━━━━━━━━━━━━\n\n"
-                f"🎉 太棒了！下週沒有安排任何行程\n"
-                f"✨ 可以好好放鬆，享受自由時光！"
-            )
-        else:
-            # 整理所有使用者的行程到一個訊息中
-            message = (
-                f"📅 下週行程預覽\n"
-                f"🗓️ {start.strftime('%m/%d')} - {end.strftime('%m/%d')}\n"
-                f"━━━━━━━━━━━━━━━━\n\n"
-            )
-            
-            # 按日期排序所有行程
-            all_schedules = []
-            for user_id, items in user_schedules.items():
-                for dt, content in items:
-                    all_schedules.append((dt, content, user_id))
-            
-            all_schedules.sort()  # 按時間排序
-            
-            current_date = None
-            for dt, content, user_id in all_schedules:
-                # 如果是新的日期，加上日期標題
-                if current_date != dt.date():
-                    current_date = dt.date()
-                    weekday_names = ["一", "二", "三", "四", "五", "六", "日"]
-                    weekday = weekday_names[dt.weekday()]
-                    message += f"\n📆 {dt.strftime('%m/%d')} (週{weekday})\n"
-                    message += "─────────────────────\n"
-                
-                # 顯示時間和內容
-                message += f"🕐 {dt.strftime('%H:%M')} │ {content}\n"
-            
-            message += "\n💡 記得提前準備，祝您一週順利！"
+        # 週報內容在新增行程時就已組好，這裡只需要發送
+        message = weekly_digest.message()
+        print(f"📈 找到 {weekly_digest.user_count()} 位使用者有下週行程")
         
         try:
-            line_bot_api.push_message(TARGET_GROUP_ID, TextSendMessage(text=message))
+            messages = [TextSendMessage(text=page) for page in paginate_text(message)]
+            push_dispatcher.push(TARGET_GROUP_ID, messages).result()
             print(f"✅ 已發送週報摘要到群組：{TARGET_GROUP_ID}")
         except Exception as e:
             print(f"❌ 推播週報到群組失敗：{e}")
@@ -531,24 +2354,6 @@ def manual_weekly_summary():
     print("🔧 手動執行每週行程摘要...")
     weekly_summary()
 
-# 🆕 排程任務 - 新增行程提醒檢查
-scheduler.add_job(
-    weekly_summary, 
-    CronTrigger(day_of_week="sun", hour=22, minute=0),
-    id="weekly_summary"
-)
-scheduler.add_job(
-    send_morning_message, 
-    CronTrigger(hour=8, minute=30),
-    id="morning_message"
-)
-
-# 🆕 關鍵新增：每分鐘檢查待發送的行程提醒
-scheduler.add_job(
-    check_and_send_pending_reminders,
-    CronTrigger(minute="*"),  # 每分鐘執行
-    id="pending_reminders"
-)
 
 # 指令對應表
 EXACT_MATCHES = {
@@ -568,341 +2373,323 @@ EXACT_MATCHES = {
     "你還會說什麼?": "what_else"
 }
 
-# 檢查文字是否為行程格式
-def is_schedule_format(text):
-    """檢查文字是否像是行程格式"""
-    parts = text.strip().split()
-    if len(parts) < 2:
-        return False
-    
-    # 檢查前兩個部分是否像日期時間格式
+# 🆕 行程文字解析：一次比對取出日期、時間與內容
+# 日期為 M/D 或 YYYY/M/D，時間與內容之間可以沒有空格（例如 7/1 14:00開會）
+# 數字只接受半形 [0-9]：\d 也會比對全形等 Unicode 數字（int() 也接受），舊版的 strptime 不會；空白仍包含全形空白
+SCHEDULE_PATTERN = re.compile(r"([0-9]+)/([0-9]+)(?:/([0-9]+))?\s+([0-9]+):([0-9]{1,2})(.*)", re.S)
+
+class ScheduleParseError(ValueError):
+    """行程文字看起來像行程但無法解析；reason 為 "format"（缺少時間或內容）或 "value"（日期時間不存在）"""
+
+    def __init__(self, reason, message=""):
+        super().__init__(message or reason)
+        self.reason = reason
+
+def parse_schedule_text(text, now=None):
+    """解析行程文字，回傳 (datetime, 內容)；不是行程格式時回傳 None，格式有誤時拋出 ScheduleParseError"""
+    match = SCHEDULE_PATTERN.fullmatch(text.strip())
+    if not match:
+        return None
+    first, second, third, hour, minute, rest = match.groups()
+    content = " ".join(rest.split())
+    if len(minute) != 2 or not content:
+        raise ScheduleParseError("format")
+    if third is None:
+        year, month, day = (now or datetime.now()).year, first, second
+    else:
+        if len(first) != 4:
+            raise ScheduleParseError("value", f"無效的年份：{first}")
+        year, month, day = int(first), second, third
+    if len(month) > 2 or len(day) > 2:
+        raise ScheduleParseError("value", f"無效的日期：{month}/{day}")
     try:
-        date_part, time_part = parts[0], parts[1]
-        
-        # 檢查日期格式 (M/D 或 YYYY/M/D)
-        if "/" in date_part:
-            date_segments = date_part.split("/")
-            if len(date_segments) == 2 or len(date_segments) == 3:
-                # 檢查是否都是數字
-                if all(segment.isdigit() for segment in date_segments):
-                    # 檢查時間格式 (HH:MM)，但允許沒有空格的情況
-                    if ":" in time_part:
-                        # 找到冒號的位置，提取時間部分
-                        colon_index = time_part.find(":")
-                        if colon_index > 0:
-                            # 提取時間部分（HH:MM）
-                            time_only = time_part[:colon_index+3]  # 包含HH:MM
-                            if len(time_only) >= 4:  # 至少要有H:MM或HH:M
-                                time_segments = time_only.split(":")
-                                if len(time_segments) == 2:
-                                    if all(segment.isdigit() for segment in time_segments):
-                                        return True
-    except:
-        pass
-    
-    return False
+        dt = datetime(int(year), int(month), int(day), int(hour[-2:]), int(minute))
+    except ValueError as e:
+        raise ScheduleParseError("value", str(e))
+    return dt, content
 
-@handler.add(MessageEvent, message=TextMessage)
-def handle_message(event):
-    user_text = event.message.text.strip()
-    lower_text = user_text.lower()
-    user_id = getattr(event.source, "group_id", None) or event.source.user_id
-    reply = None  # 預設不回應
+# 🆕 指令路由：啟動時建立一次查表，完全吻合的指令 O(1) 查詢，
+# 其他格式（抽籤、風雲榜、行程）先用便宜的前置檢查過濾，一般聊天訊息直接略過
+class CommandRouter:
+    """訊息指令分派器，處理函式的參數為 (event, text, user_id)，回傳回覆文字或 None"""
 
-    # 🆕 抽籤功能處理 - 優先處理
-    if user_text.startswith("抽") and len(user_text) == 2:
-        reply = process_lottery(user_text)
-        if reply:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply))
-            return
+    def __init__(self):
+        self._exact = {}
+        self._matchers = []
 
-    # 風雲榜功能處理 - 優先處理，並且只在有效格式時處理
-    if is_valid_ranking_format(user_text):
-        reply = process_ranking_input(user_id, user_text)
-        # 只有當 reply 不是 None 時才回應
-        if reply:
-            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply))
-            return
+    def add(self, name, func):
+        self._exact[name.lower()] = func
 
-    # 群組管理指令
-    if lower_text == "設定早安群組":
-        group_id = getattr(event.source, "group_id", None)
-        if group_id:
-            global TARGET_GROUP_ID
-            TARGET_GROUP_ID = group_id
-            reply = (
-                "✅ 群組設定成功！\n"
-                "━━━━━━━━━━━━━━━━\n"
-                f"📱 群組 ID：{group_id}\n"
-                f"🌅 早安訊息：每天早上 8:30\n"
-                f"📅 週報摘要：每週日晚上 22:00\n\n"
-                f"💡 所有推播功能已啟用！"
-            )
-        else:
-            reply = "❌ 此指令只能在群組中使用"
-    elif lower_text == "查看群組設定":
-        status = "✅ 已設定推播群組" if TARGET_GROUP_ID != "C4e138aa0eb252daa89846daab0102e41" else "❌ 尚未設定推播群組"
-        reply = (
-            f"📊 群組設定狀態\n"
+    def command(self, *names):
+        """註冊完全吻合（不分大小寫）的指令"""
+        def decorator(func):
+            for name in names:
+                self.add(name, func)
+            return func
+        return decorator
+
+    def matcher(self, prefilter):
+        """註冊格式指令，prefilter 必須是很便宜的檢查；處理函式回傳 None 時繼續嘗試下一個"""
+        def decorator(func):
+            self._matchers.append((prefilter, func))
+            return func
+        return decorator
+
+    def dispatch(self, event, text, user_id):
+        func = self._exact.get(text.lower())
+        if func:
+            return func(event, text, user_id)
+        for prefilter, func in self._matchers:
+            if prefilter(text):
+                reply = func(event, text, user_id)
+                if reply:
+                    return reply
+        return None
+
+command_router = CommandRouter()
+
+# 🆕 抽籤功能處理 - 優先處理
+@command_router.matcher(lambda text: len(text) == 2 and text[0] == "抽")
+def handle_lottery(event, text, user_id):
+    return process_lottery(text)
+
+# 風雲榜功能處理 - 只在有效格式時處理
+@command_router.matcher(lambda text: text == "風雲榜" or text.count("\n") == 8)
+def handle_ranking(event, text, user_id):
+    if is_valid_ranking_format(text):
+        return process_ranking_input(user_id, text)
+    return None
+
+# 檢查是否為行程格式（行程一定以日期數字開頭），不是行程格式時 try_add_schedule 回傳 None
+@command_router.matcher(lambda text: text[:1].isascii() and text[:1].isdigit())
+def handle_add_schedule(event, text, user_id):
+    return try_add_schedule(text, user_id)
+
+# 群組管理指令
+@command_router.command("設定早安群組")
+def handle_set_morning_group(event, text, user_id):
+    group_id = getattr(event.source, "group_id", None)
+    if not group_id:
+        return "❌ 此指令只能在群組中使用"
+    global TARGET_GROUP_ID
+    TARGET_GROUP_ID = group_id
+    return (
+        "✅ 群組設定成功！\n"
+        "━━━━━━━━━━━━━━━━\n"
+        f"📱 群組 ID：{group_id}\n"
+        f"🌅 早安訊息：每天早上 8:30\n"
+        f"📅 週報摘要：每週日晚上 22:00\n\n"
+        f"💡 所有推播功能已啟用！"
+    )
+
+@command_router.command("查看群組設定")
+def handle_group_status(event, text, user_id):
+    status = "✅ 已設定推播群組" if TARGET_GROUP_ID != "C4e138aa0eb252daa89846daab0102e41" else "❌ 尚未設定推播群組"
+    return (
+        f"📊 群組設定狀態\n"
+        f"━━━━━━━━━━━━━━━━\n"
+        f"📱 群組 ID：{TARGET_GROUP_ID}\n"
+        f"🔔 推播狀態：{status}\n\n"
+        f"🕐 自動推播時間：\n"
+        f"   • 早安訊息：每天 8:30\n"
+        f"   • 週報摘要：每週日 22:00\n"
+        f"   • 行程提醒：準時推播"
+    )
+
+@command_router.command("測試早安")
+def handle_test_morning(event, text, user_id):
+    group_id = getattr(event.source, "group_id", None)
+    if group_id == TARGET_GROUP_ID or TARGET_GROUP_ID == "C4e138aa0eb252daa89846daab0102e41":
+        return "🌅 早安！新的一天開始了 ✨\n\n願你今天充滿活力與美好！"
+    return "⚠️ 此群組未設定為推播群組"
+
+@command_router.command("測試週報")
+def handle_test_weekly_summary(event, text, user_id):
+    try:
+        manual_weekly_summary()
+        # 週報只推播到設定的群組，不回覆在觸發指令的聊天室（其他聊天室的行程不能外流）
+        return "✅ 週報已手動執行完成\n📝 請檢查執行記錄確認推播狀況"
+    except Exception as e:
+        return f"❌ 週報執行失敗：{str(e)}"
+
+@command_router.command("檢查行程", "測試提醒")
+def handle_check_reminders(event, text, user_id):
+    try:
+        check_and_send_pending_reminders()
+        return "✅ 行程提醒檢查已手動執行\n📝 請查看日誌確認處理結果"
+    except Exception as e:
+        return f"❌ 行程檢查失敗：{str(e)}"
+
+@command_router.command("查看id")
+def handle_show_id(event, text, user_id):
+    group_id = getattr(event.source, "group_id", None)
+    user_id_display = event.source.user_id
+    if group_id:
+        return (
+            f"📋 當前資訊\n"
             f"━━━━━━━━━━━━━━━━\n"
-            f"📱 群組 ID：{TARGET_GROUP_ID}\n"
-            f"🔔 推播狀態：{status}\n\n"
-            f"🕐 自動推播時間：\n"
-            f"   • 早安訊息：每天 8:30\n"
-            f"   • 週報摘要：每週日 22:00\n"
-            f"   • 行程提醒：每分鐘檢查"
+            f"👥 群組 ID：{group_id}\n"
+            f"👤 使用者 ID：{user_id_display}"
         )
-    elif lower_text == "測試早安":
-        group_id = getattr(event.source, "group_id", None)
-        if group_id == TARGET_GROUP_ID or TARGET_GROUP_ID == "C4e138aa0eb252daa89846daab0102e41":
-            reply = "🌅 早安！新的一天開始了 ✨\n\n願你今天充滿活力與美好！"
-        else:
-            reply = "⚠️ 此群組未設定為推播群組"
-    elif lower_text == "測試週報":
-        try:
-            manual_weekly_summary()
-            reply = "✅ 週報已手動執行完成\n📝 請檢查執行記錄確認推播狀況"
-        except Exception as e:
-            reply = f"❌ 週報執行失敗：{str(e)}"
-    elif lower_text == "檢查行程" or lower_text == "測試提醒":
-        try:
-            check_and_send_pending_reminders()
-            reply = "✅ 行程提醒檢查已手動執行\n📝 請查看日誌確認處理結果"
-        except Exception as e:
-            reply = f"❌ 行程檢查失敗：{str(e)}"
-    elif lower_text == "查看id":
-        group_id = getattr(event.source, "group_id", None)
-        user_id_display = event.source.user_id
-        if group_id:
-            reply = (
-                f"📋 當前資訊\n"
-                f"━━━━━━━━━━━━━━━━\n"
-                f"👥 群組 ID：{group_id}\n"
-                f"👤 使用者 ID：{user_id_display}"
-            )
-        else:
-            reply = (
-                f"📋 當前資訊\n"
-                f"━━━━━━━━━━━━━━━━\n"
-                f"👤 使用者 ID：{user_id_display}\n"
-                f"💬 環境：個人對話"
-            )
-    elif lower_text == "查看排程":
-        try:
-            jobs = scheduler.get_jobs()
-            if jobs:
-                job_info = []
-                for job in jobs:
-                    next_run = job.next_run_time.strftime('%Y/%m/%d %H:%M:%S') if job.next_run_time else "未設定"
-                    job_name = "早安訊息" if job.id == "morning_message" else "週報摘要" if job.id == "weekly_summary" else "行程提醒檢查" if job.id == "pending_reminders" else job.id
-                    job_info.append(f"   • {job_name}：{next_run}")
-                reply = (
-                    f"⚙️ 系統排程狀態\n"
-                    f"━━━━━━━━━━━━━━━━\n"
-                    f"📊 運行中的排程工作：\n" + 
-                    "\n".join(job_info)
-                )
-            else:
-                reply = "❌ 沒有找到任何排程工作"
-        except Exception as e:
-            reply = f"❌ 查看排程失敗：{str(e)}"
-    elif lower_text in ["功能說明", "說明", "help", "如何增加行程"]:
-        reply = send_help_message()
-    else:
-        reply_type = next((v for k, v in EXACT_MATCHES.items() if k.lower() == lower_text), None)
-
-        if reply_type == "hello":
-            reply = "🙋‍♀️ 怎樣？有什麼需要幫忙的嗎？"
-        elif reply_type == "hi":
-            reply = "👋 呷飽沒？需要安排什麼行程嗎？"
-        elif reply_type == "what_else":
-            reply = "💕 我愛你 ❤️\n\n還有很多功能等你發現喔！\n輸入「功能說明」查看完整指令列表～"
-        elif reply_type == "countdown_3":
-            reply = (
-                "⏰ 3分鐘倒數計時開始！\n"
-                "━━━━━━━━━━━━━━━━\n"
-                "🕐 計時器已啟動\n"
-                "📢 3分鐘後我會提醒您時間到了"
-            )
-            scheduler.add_job(
-                send_countdown_reminder,
-                trigger="date",
-                run_date=datetime.now() + timedelta(minutes=3),
-                args=[user_id, 3],
-                id=f"countdown_3_{user_id}_{datetime.now().timestamp()}"
-            )
-        elif reply_type == "countdown_5":
-            reply = (
-                "⏰ 5分鐘倒數計時開始！\n"
-                "━━━━━━━━━━━━━━━━\n"
-                "🕐 計時器已啟動\n"
-                "📢 5分鐘後我會提醒您時間到了"
-            )
-            scheduler.add_job(
-                send_countdown_reminder,
-                trigger="date",
-                run_date=datetime.now() + timedelta(minutes=5),
-                args=[user_id, 5],
-                id=f"countdown_5_{user_id}_{datetime.now().timestamp()}"
-            )
-        elif reply_type:
-            reply = get_schedule(reply_type, user_id)
-        else:
-            # 檢查是否為行程格式
-            if is_schedule_format(user_text):
-                reply = try_add_schedule(user_text, user_id)
-            # 如果不是行程格式，就不回應（reply 保持 None）
+    return (
+        f"📋 當前資訊\n"
+        f"━━━━━━━━━━━━━━━━\n"
+        f"👤 使用者 ID：{user_id_display}\n"
+        f"💬 環境：個人對話"
+    )
+
+@command_router.command("查看排程")
+def handle_show_jobs(event, text, user_id):
+    try:
+        jobs = scheduler.get_jobs()
+        if not jobs:
+            return "❌ 沒有找到任何排程工作"
+        job_info = []
+        for job in jobs:
+            next_run = job.next_run_time.strftime('%Y/%m/%d %H:%M:%S') if job.next_run_time else "未設定"
+            job_name = "早安訊息" if job.id == "morning_message" else "週報摘要" if job.id == "weekly_summary" else "行程提醒檢查" if job.id == "pending_reminders" else "行程封存" if job.id == "schedule_compaction" else "倒數計時接手" if job.id == "countdown_restore" else job.id
+            job_info.append(f"   • {job_name}：{next_run}")
+        return (
+            f"⚙️ 系統排程狀態\n"
+            f"━━━━━━━━━━━━━━━━\n"
+            f"👑 此行程{'負責' if leader_elector.is_leader else '不負責'}執行定時工作\n"
+            f"🗂️ 日期解析快取命中率：{sheet_datetime_cache_stats()['hit_rate']:.0%}\n"
+            f"💬 行程查詢快取命中率：{schedule_reply_cache.stats()['hit_rate']:.0%}\n"
+            f"📊 運行中的排程工作：\n" + 
+            "\n".join(job_info)
+        )
+    except Exception as e:
+        return f"❌ 查看排程失敗：{str(e)}"
+
+@command_router.command("功能說明", "說明", "help", "如何增加行程")
+def handle_help(event, text, user_id):
+    return send_help_message()
+
+def handle_countdown(minutes):
+    def handler_func(event, text, user_id):
+        start_countdown(user_id, minutes)
+        return (
+            f"⏰ {minutes}分鐘倒數計時開始！\n"
+            "━━━━━━━━━━━━━━━━\n"
+            "🕐 計時器已啟動\n"
+            f"📢 {minutes}分鐘後我會提醒您時間到了"
+        )
+    return handler_func
+
+def handle_period_query(period):
+    def handler_func(event, text, user_id):
+        return get_schedule(period, user_id)
+    return handler_func
+
+REPLY_TYPE_HANDLERS = {
+    "hello": lambda event, text, user_id: "🙋‍♀️ 怎樣？有什麼需要幫忙的嗎？",
+    "hi": lambda event, text, user_id: "👋 呷飽沒？需要安排什麼行程嗎？",
+    "what_else": lambda event, text, user_id: "💕 我愛你 ❤️\n\n還有很多功能等你發現喔！\n輸入「功能說明」查看完整指令列表～",
+    "countdown_3": handle_countdown(3),
+    "countdown_5": handle_countdown(5),
+}
+
+for command_text, reply_type in EXACT_MATCHES.items():
+    command_router.add(command_text, REPLY_TYPE_HANDLERS.get(reply_type) or handle_period_query(reply_type))
+
+@handler.add(MessageEvent, message=TextMessage)
+def handle_message(event):
+    user_text = event.message.text.strip()
+    user_id = getattr(event.source, "group_id", None) or event.source.user_id
+    reply = command_router.dispatch(event, user_text, user_id)
 
-    # 只有在 reply 不為 None 時才回應
+    # 只有在 reply 不為 None 時才回應，過長的回覆分成多則訊息
     if reply:
-        line_bot_api.reply_message(event.reply_token, TextSendMessage(text=reply))
+        line_bot_api.reply_message(event.reply_token, [TextSendMessage(text=page) for page in paginate_text(reply)])
+
+def period_range(period, now):
+    """回傳查詢期間的 [start, end) 範圍"""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "today":
+        return today, today + timedelta(days=1)
+    if period == "tomorrow":
+        return today + timedelta(days=1), today + timedelta(days=2)
+    if period in ("this_week", "next_week"):
+        monday = today - timedelta(days=today.weekday())
+        if period == "next_week":
+            monday += timedelta(days=7)
+        return monday, monday + timedelta(days=7)
+    month_start = today.replace(day=1)
+    next_month_start = (month_start + timedelta(days=32)).replace(day=1)
+    if period == "this_month":
+        return month_start, next_month_start
+    if period == "next_month":
+        return next_month_start, (next_month_start + timedelta(days=32)).replace(day=1)
+    if period == "next_year":
+        return today.replace(year=now.year + 1, month=1, day=1), today.replace(year=now.year + 2, month=1, day=1)
+    return now, now
 
 def get_schedule(period, user_id):
     try:
-        all_rows = sheet.get_all_values()[1:]
         now = datetime.now()
-        schedules = []
-
-        # 定義期間名稱和表情符號
-        period_info = {
-            "today": {"name": "今日行程", "emoji": "📅", "empty_msg": "今天沒有安排任何行程，可以放鬆一下！"},
-            "tomorrow": {"name": "明日行程", "emoji": "📋", "empty_msg": "明天目前沒有安排，有個輕鬆的一天！"},
-            "this_week": {"name": "本週行程", "emoji": "📊", "empty_msg": "本週沒有特別安排，享受自由的時光！"},
-            "next_week": {"name": "下週行程", "emoji": "🗓️", "empty_msg": "下週暫時沒有安排，可以開始規劃了！"},
-            "this_month": {"name": "本月行程", "emoji": "📆", "empty_msg": "本月份目前沒有特別安排！"},
-            "next_month": {"name": "下個月行程", "emoji": "🗂️", "empty_msg": "下個月還沒有安排，提前規劃很棒！"},
-            "next_year": {"name": "明年行程", "emoji": "🎯", "empty_msg": "明年的規劃還是空白，充滿無限可能！"}
-        }
-
-        for row in all_rows:
-            if len(row) < 5:
-                continue
-            try:
-                date_str, time_str, content, uid, _ = row
-                dt = datetime.strptime(f"{date_str.strip()} {time_str.strip()}", "%Y/%m/%d %H:%M")
-            except Exception as e:
-                print(f"❌ 解析時間失敗：{e}")
-                continue
-
-            if user_id.lower() != uid.lower():
-                continue
+        bucket = period_range(period, now)[0]
+        return schedule_reply_cache.get(user_id, period, bucket, lambda: render_schedule(period, user_id, now))
+    except Exception as e:
+        print(f"❌ 取得行程失敗：{e}")
+        return "❌ 取得行程時發生錯誤，請稍後再試。"
 
-            if (
-                (period == "today" and dt.date() == now.date()) or
-                (period == "tomorrow" and dt.date() == (now + timedelta(days=1)).date()) or
-                (period == "this_week" and dt.isocalendar()[1] == now.isocalendar()[1] and dt.year == now.year) or
-                (period == "next_week" and dt.isocalendar()[1] == (now + timedelta(days=7)).isocalendar()[1] and dt.year == (now + timedelta(days=7)).year) or
-                (period == "this_month" and dt.year == now.year and dt.month == now.month) or
-                (period == "next_month" and (
-                    dt.year == (now.year + 1 if now.month == 12 else now.year)
-                ) and dt.month == ((now.month % 12) + 1)) or
-                (period == "next_year" and dt.year == now.year + 1)
-            ):
-                schedules.append((dt, content))
+def render_schedule(period, user_id, now):
+    """組出使用者在查詢期間內的行程回覆"""
+    # 定義期間名稱和表情符號
+    period_info = {
+        "today": {"name": "今日行程", "emoji": "📅", "empty_msg": "今天沒有安排任何行程，可以放鬆一下！"},
+        "tomorrow": {"name": "明日行程", "emoji": "📋", "empty_msg": "明天目前沒有安排，有個輕鬆的一天！"},
+        "this_week": {"name": "本週行程", "emoji": "📊", "empty_msg": "本週沒有特別安排，享受自由的時光！"},
+        "next_week": {"name": "下週行程", "emoji": "🗓️", "empty_msg": "下週暫時沒有安排，可以開始規劃了！"},
+        "this_month": {"name": "本月行程", "emoji": "📆", "empty_msg": "本月份目前沒有特別安排！"},
+        "next_month": {"name": "下個月行程", "emoji": "🗂️", "empty_msg": "下個月還沒有安排，提前規劃很棒！"},
+        "next_year": {"name": "明年行程", "emoji": "🎯", "empty_msg": "明年的規劃還是空白，充滿無限可能！"}
+    }
 
-        info = period_info.get(period, {"name": "行程", "emoji": "📅", "empty_msg": "目前沒有相關行程"})
-        
-        if not schedules:
-            return (
-                f"{info['emoji']} {info['name']}\n"
-                f"━━━━━━━━━━━━━━━━\n\n"
-                f"🎉 {info['empty_msg']}"
-            )
+    if period == "next_week":
+        schedules = weekly_digest.query(user_id, now)
+    else:
+        start, end = period_range(period, now)
+        schedules = schedule_index.query(user_id, start, end)
 
-        # 按時間排序
-        schedules.sort()
-        
-        # 格式化輸出
-        result = (
+    info = period_info.get(period, {"name": "行程", "emoji": "📅", "empty_msg": "目前沒有相關行程"})
+    
+    if not schedules:
+        return (
             f"{info['emoji']} {info['name']}\n"
             f"━━━━━━━━━━━━━━━━\n\n"
+            f"🎉 {info['empty_msg']}"
         )
+
+    # 格式化輸出（索引已依時間排序），一次走訪依日期分組
+    lines = [f"{info['emoji']} {info['name']}", "━━━━━━━━━━━━━━━━", ""]
+    multi_day = len(schedules) > 1 and period in ["this_week", "next_week", "this_month", "next_month", "next_year"]
+    weekday_names = ["一", "二", "三", "四", "五", "六", "日"]
+    
+    current_date = None
+    for dt, content in schedules:
+        # 如果是新的日期，加上日期標題；多日期顯示時以空行分隔
+        if multi_day and current_date != dt.date():
+            if current_date is not None:
+                lines.append("")
+            current_date = dt.date()
+            lines.append(f"📆 {dt.strftime('%m/%d')} (週{weekday_names[dt.weekday()]})")
+            lines.append("─────────────────────")
         
-        current_date = None
-        weekday_names = ["一", "二", "三", "四", "五", "六", "日"]
-        
-        for dt, content in schedules:
-            # 如果是新的日期，加上日期標題
-            if current_date != dt.date():
-                current_date = dt.date()
-                if len(schedules) > 1 and period in ["this_week", "next_week", "this_month", "next_month", "next_year"]:
-                    weekday = weekday_names[dt.weekday()]
-                    result += f"📆 {dt.strftime('%m/%d')} (週{weekday})\n"
-                    result += "─────────────────────\n"
-            
-            # 顯示時間和內容
-            result += f"🕐 {dt.strftime('%H:%M')} │ {content}\n"
-            
-            # 在多日期顯示時添加空行
-            if len(schedules) > 1 and period in ["this_week", "next_week", "this_month", "next_month", "next_year"]:
-                # 檢查下一個行程是否是不同日期
-                current_index = schedules.index((dt, content))
-                if current_index < len(schedules) - 1:
-                    next_dt, _ = schedules[current_index + 1]
-                    if next_dt.date() != dt.date():
-                        result += "\n"
-
-        # 添加友善的結尾
-        if len(schedules) > 0:
-            result += "\n💡 記得提前準備，祝您順利完成所有安排！"
-
-        return result.rstrip()
-        
-    except Exception as e:
-        print(f"❌ 取得行程失敗：{e}")
-        return "❌ 取得行程時發生錯誤，請稍後再試。"
+        # 顯示時間和內容
+        lines.append(f"🕐 {dt.strftime('%H:%M')} │ {content}")
+
+    # 添加友善的結尾
+    lines.append("")
+    lines.append("💡 記得提前準備，祝您順利完成所有安排！")
+
+    return "\n".join(lines)
 
 def try_add_schedule(text, user_id):
     try:
-        parts = text.strip().split()
-        if len(parts) >= 2:
-            date_part = parts[0]
-            time_and_content = " ".join(parts[1:])
-            
-            # 處理時間和內容可能沒有空格分隔的情況
-            time_part = None
-            content = None
-            
-            # 尋找時間格式 HH:MM
-            if ":" in time_and_content:
-                colon_index = time_and_content.find(":")
-                if colon_index >= 1:
-                    # 找到時間的開始位置
-                    time_start = max(0, colon_index - 2)
-                    while time_start < colon_index and not time_and_content[time_start].isdigit():
-                        time_start += 1
-                    
-                    # 找到時間的結束位置（冒號後2位數字）
-                    time_end = colon_index + 3
-                    if time_end <= len(time_and_content):
-                        potential_time = time_and_content[time_start:time_end]
-                        # 驗證時間格式
-                        if ":" in potential_time:
-                            time_segments = potential_time.split(":")
-                            if len(time_segments) == 2 and all(seg.isdigit() for seg in time_segments):
-                                time_part = potential_time
-                                content = time_and_content[time_end:].strip()
-                                
-                                # 如果沒有內容，可能是因為時間和內容之間沒有空格
-                                if not content:
-                                    content = time_and_content[time_end:].strip()
-            
-            # 如果無法解析時間，返回格式錯誤
-            if not time_part or not content:
-                return (
-                    "❌ 時間格式錯誤\n"
-                    "━━━━━━━━━━━━━━━━\n"
-                    "📝 正確格式：月/日 時:分 行程內容\n\n"
-                    "✅ 範例：\n"
-                    "   • 7/1 14:00 開會\n"
-                    "   • 12/25 09:30 聖誕聚餐"
-                )
-            
-            # 如果日期格式是 M/D，自動加上當前年份
-            if date_part.count("/") == 1:
-                date_part = f"{datetime.now().year}/{date_part}"
-            
-            dt = datetime.strptime(f"{date_part} {time_part}", "%Y/%m/%d %H:%M")
+        parsed = parse_schedule_text(text)
+        if parsed:
+            dt, content = parsed
             
             # 檢查日期是否為過去時間
             if dt < datetime.now():
@@ -913,28 +2700,39 @@ def try_add_schedule(text, user_id):
                     "💡 只能安排未來的行程喔！"
                 )
             
-            # 🆕 修改：新增行程時同時新增提醒
-            # 新增主要行程
-            sheet.append_row([
+            # 🆕 行程與所有提醒（依 REMINDER_LEAD_TIMES）在同一個交易中寫入，
+            # 同步到試算表時也會合併成單次 append_rows
+            rows = [[
                 dt.strftime("%Y/%m/%d"),
                 dt.strftime("%H:%M"),
                 content,
                 user_id,
                 ""
-            ])
-            
-            # 🆕 新增提醒行程（行程前1小時）
-            reminder_dt = dt - timedelta(hours=1)
-            if reminder_dt > datetime.now():
-                reminder_content = f"⏰ 溫馨提醒：一小時後有「{content}」"
-                sheet.append_row([
+            ]]
+            reminder_labels = []
+            for lead, label in REMINDER_LEAD_TIMES:
+                reminder_dt = dt - lead
+                if reminder_dt <= datetime.now():
+                    continue
+                reminder_content = f"⏰ 溫馨提醒：{label}後有「{content}」"
+                rows.append([
                     reminder_dt.strftime("%Y/%m/%d"),
                     reminder_dt.strftime("%H:%M"),
                     reminder_content,
                     user_id,
                     "待發送"
                 ])
-                print(f"✅ 已新增提醒行程: {reminder_content} at {reminder_dt}")
+                reminder_labels.append(label)
+            schedule_store.add_rows(rows)
+            weekly_digest.refresh()
+            if leader_elector.is_leader:
+                # 立即排入提醒佇列，讓計時執行緒準時發送
+                sweep_pending_reminders()
+            else:
+                # 提醒由 leader 發送，通知 leader 立即載入
+                reminder_wake.notify()
+            for row in rows[1:]:
+                print(f"✅ 已新增提醒行程: {row[2]} at {row[0]} {row[1]}")
             
             weekday_names = ["一", "二", "三", "四", "五", "六", "日"]
             weekday = weekday_names[dt.weekday()]
@@ -946,9 +2744,19 @@ def try_add_schedule(text, user_id):
                 f"🕐 時間：{dt.strftime('%H:%M')}\n"
                 f"📝 內容：{content}\n"
                 f"━━━━━━━━━━━━━━━━\n"
-                f"⏰ 系統會在一小時前自動提醒您！"
+                f"⏰ 系統會在{'、'.join(reminder_labels or [label for _, label in REMINDER_LEAD_TIMES])}前自動提醒您！"
+            )
+    except ScheduleParseError as e:
+        if e.reason == "format":
+            # 無法解析時間或沒有內容，返回格式錯誤
+            return (
+                "❌ 時間格式錯誤\n"
+                "━━━━━━━━━━━━━━━━\n"
+                "📝 正確格式：月/日 時:分 行程內容\n\n"
+                "✅ 範例：\n"
+                "   • 7/1 14:00 開會\n"
+                "   • 12/25 09:30 聖誕聚餐"
             )
-    except ValueError as e:
         print(f"❌ 時間格式錯誤：{e}")
         return (
             "❌ 時間格式解析失敗\n"
@@ -967,7 +2775,276 @@ def try_add_schedule(text, user_id):
     
     return None
 
+# 🆕 排程任務 - 新增行程提醒檢查（每個行程都註冊，但只有 leader 會實際執行）
+def register_scheduled_jobs():
+    scheduler.add_job(
+        leader_only(weekly_summary),
+        CronTrigger(day_of_week="sun", hour=22, minute=0),
+        id="weekly_summary"
+    )
+    scheduler.add_job(
+        leader_only(send_morning_message),
+        CronTrigger(hour=8, minute=30),
+        id="morning_message"
+    )
+
+    # 🆕 提醒由 reminder_timer 準時發送；其他行程新增的提醒經由喚醒通道立即載入，這裡是定期的備援掃描
+    scheduler.add_job(
+        leader_only(sweep_pending_reminders),
+        "interval",
+        seconds=REMINDER_SWEEP_INTERVAL,
+        next_run_time=datetime.now(),
+        id="pending_reminders"
+    )
+
+    # 🆕 背景同步本地資料庫與 Google 試算表（啟動時立即執行一次以匯入既有資料）
+    scheduler.add_job(
+        leader_only(sync_sheet),
+        "interval",
+        seconds=SHEET_SYNC_INTERVAL,
+        next_run_time=datetime.now(),
+        id="sheet_sync"
+    )
+
+    # 🆕 接手其他 worker 留下的倒數計時（例如非 leader 的 worker 重啟或當機），重複的會在發送時被過濾
+    scheduler.add_job(
+        leader_only(restore_countdowns),
+        "interval",
+        seconds=COUNTDOWN_RESTORE_INTERVAL,
+        id="countdown_restore"
+    )
+
+    # 🆕 每天凌晨封存舊資料：只在設定了封存工作表時啟用，
+    # 否則舊資料只會留在本機的 bot.db，容器重建後試算表上的歷史紀錄就不見了
+    if schedule_compactor.archive_worksheet is not None:
+        scheduler.add_job(
+            leader_only(schedule_compactor.compact),
+            CronTrigger(hour=SCHEDULE_COMPACT_HOUR, minute=15),
+            id="schedule_compaction"
+        )
+    else:
+        print("ℹ️ 未設定 SCHEDULE_ARCHIVE_WORKSHEET，不執行行程封存")
+
+# 🆕 Leader 選舉：所有行程都處理 webhook，但只有 leader 執行定時工作
+LEADER_BACKEND = os.getenv("LEADER_BACKEND", "file")
+LEADER_LOCK_PATH = os.getenv("LEADER_LOCK_PATH", f"{BOT_DB_PATH}.leader.lock")
+LEADER_CHECK_INTERVAL = int(os.getenv("LEADER_CHECK_INTERVAL", 10))
+LEADER_LEASE_TTL = int(os.getenv("LEADER_LEASE_TTL", 30))
+
+class FileLockLeaderBackend:
+    """以檔案鎖選舉（同一台主機），行程結束時作業系統會自動釋放"""
+
+    def __init__(self, path=LEADER_LOCK_PATH):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class SQLiteLeaseLeaderBackend:
+    """以 SQLite 租約選舉，leader 需在租約到期前續約"""
+
+    def __init__(self, connect=db_connect, name="scheduler", ttl=LEADER_LEASE_TTL):
+        self.connect = connect
+        self.name = name
+        self.ttl = ttl
+        with self.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def acquire(self):
+        now = time.time()
+        with self.connect() as conn:
+            # 租約屬於自己時續約，租約過期時接手
+            conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (self.name, PROCESS_ID, now + self.ttl, now)
+            )
+            owner = conn.execute("SELECT owner FROM leases WHERE name = ?", (self.name,)).fetchone()[0]
+        return owner == PROCESS_ID
+
+    def release(self):
+        with self.connect() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, PROCESS_ID))
+
+class SingleProcessLeaderBackend:
+    """單一行程部署時使用，永遠是 leader"""
+
+    def acquire(self):
+        return True
+
+    def release(self):
+        pass
+
+# 可依需要註冊其他選舉方式（例如 Redis）
+LEADER_BACKENDS = {
+    "file": FileLockLeaderBackend,
+    "sqlite": SQLiteLeaseLeaderBackend,
+    "none": SingleProcessLeaderBackend,
+}
+
+class LeaderElector:
+    """定期嘗試取得或續約 leader 身分"""
+
+    def __init__(self, backend, interval=LEADER_CHECK_INTERVAL):
+        self.backend = backend
+        self.interval = interval
+        self.is_leader = False
+        self._on_elected = []
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def on_elected(self, callback):
+        self._on_elected.append(callback)
+        return callback
+
+    def check(self):
+        try:
+            leader = self.backend.acquire()
+        except Exception as e:
+            print(f"❌ Leader 選舉失敗：{e}")
+            leader = False
+        if leader and not self.is_leader:
+            print(f"👑 此行程成為 leader，負責執行定時工作（{PROCESS_ID}）")
+            self.is_leader = True
+            for callback in self._on_elected:
+                callback()
+        elif not leader and self.is_leader:
+            print(f"⚠️ 此行程失去 leader 身分（{PROCESS_ID}）")
+            self.is_leader = False
+        return self.is_leader
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self._thread is None:
+            self.check()
+            self._thread = threading.Thread(target=self._run, name="leader-elector", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_leader:
+            self.backend.release()
+            self.is_leader = False
+
+def create_leader_backend(name=LEADER_BACKEND):
+    if name == "file" and fcntl is None:
+        name = "none"
+    return LEADER_BACKENDS[name]()
+
+leader_elector = LeaderElector(create_leader_backend())
+
+def leader_only(func):
+    """包裝定時工作：非 leader 行程直接略過，執行時間記錄到 linebot_job_duration_seconds"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not leader_elector.is_leader:
+            return None
+        with JOB_DURATION_SECONDS.time(job=func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+# 成為 leader 時接手尚未完成的倒數計時（重複的倒數在發送時會被過濾）
+leader_elector.on_elected(restore_countdowns)
+
+@leader_elector.on_elected
+def take_over_reminders():
+    """成為 leader 時接收其他 worker 的喚醒通知，並立即載入待發送的提醒"""
+    reminder_wake.listen(wake_reminder_timer)
+    sweep_pending_reminders()
+
+_scheduler_start_lock = threading.Lock()
+
+def ensure_scheduler_started():
+    """沒有定時工作的行程在第一次需要時（例如倒數計時）才啟動排程器"""
+    with _scheduler_start_lock:
+        if not scheduler.running:
+            scheduler.start()
+
+_background_pid = None  # 啟動背景服務的行程；fork 出來的子行程不會繼承執行緒
+_background_lock = threading.Lock()
+
+def start_background_services():
+    """啟動背景服務（每個行程可重複呼叫，只會執行一次）"""
+    global _background_pid
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        if _background_pid is not None:
+            _background_pid = os.getpid()
+            print(
+                "🚨 背景服務是在 fork 之前啟動的（例如 gunicorn --preload 搭配 BOT_AUTOSTART=1），"
+                "這個 worker 沒有排程、同步與提醒執行緒，新增的行程不會寫入試算表！"
+            )
+            return
+        _background_pid = os.getpid()
+    register_scheduled_jobs()
+    leader_elector.start()
+    ensure_scheduler_started()
+    # 重啟前在本 worker 建立的倒數計時立即恢復，不必等 leader 接手
+    restore_countdowns()
+    reminder_timer.start()
+    ranking_buffer.recover()
+
+def stop_background_services():
+    """關閉時依序執行：處理完佇列中的 webhook 事件、把尚未同步的行程與狀態寫回試算表，最後才釋放 leader"""
+    webhook_queue.drain()
+    # 行程以本機資料庫為主，回覆「新增成功」時還沒寫入試算表；容器重建後 bot.db 就不見了。
+    # 與 sheet_sync 相同只由 leader 寫入，非 leader 的變更已在共用的資料庫中，會一起寫回
+    if leader_elector.is_leader:
+        try:
+            sheet_replicator.push_changes()
+        except Exception as e:
+            print(f"❌ 關閉前寫回試算表失敗：{e}")
+    reminder_wake.close()
+    leader_elector.stop()
+
+atexit.register(stop_background_services)
+
+# 🆕 應用程式工廠：背景服務（排程器、leader 選舉、提醒計時執行緒）只在呼叫 create_app() 時啟動，
+# 單純 import app 不會建立執行緒或連線到 Google。
+# 部署時請用 gunicorn 'app:create_app()'，不要加 --preload：preload 會在 master 行程啟動服務並取得
+# leader 鎖，fork 出來的 worker 繼承了鎖與 scheduler.running 狀態，卻沒有任何背景執行緒。
+def create_app():
+    start_background_services()
+    return app
+
+# 🆕 以 gunicorn app:app 等方式部署、沒有呼叫 create_app() 時，每個 worker 在收到第一個請求時啟動背景服務。
+# 這時已經 fork 完成，執行緒與 leader 鎖都屬於 worker 自己。
+@app.before_request
+def start_background_services_on_first_request():
+    if _background_pid != os.getpid():
+        try:
+            start_background_services()
+        except Exception as e:
+            print(f"❌ 啟動背景服務失敗：{e}")
+
+# 設定 BOT_AUTOSTART=1 時 import 即啟動，不必等第一個請求（不能與 --preload 一起使用）
+if os.getenv("BOT_AUTOSTART", "0") == "1":
+    create_app()
+
 if __name__ == "__main__":
+    create_app()
     print("🤖 LINE 行程助理啟動中...")
     print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
     print("🎲 抽籤功能：")
@@ -982,12 +3059,13 @@ if __name__ == "__main__":
     print("📅 自動排程服務：")
     print("   🌅 每天早上 8:30 - 溫馨早安訊息")
     print("   📊 每週日晚上 22:00 - 下週行程摘要")
-    print("   ⏰ 每分鐘檢查 - 自動行程提醒推播")
+    print("   ⏰ 準時推播 - 自動行程提醒")
     print("⏰ 倒數計時功能：")
     print("   🕐 倒數3分鐘：輸入 '倒數3分鐘' 或 '倒數計時' 或 '開始倒數'")
     print("   🕐 倒數5分鐘：輸入 '倒數5分鐘'")
     print("🔧 測試指令：")
     print("   📝 檢查行程 / 測試提醒 - 手動檢查待發送行程")
+    print("📈 監控指標：GET /metrics（Prometheus 文字格式）")
     print("💡 輸入 '功能說明' 查看完整功能列表")
     print("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━")
     
@@ -997,7 +3075,7 @@ if __name__ == "__main__":
         print(f"✅ 系統狀態：已載入 {len(jobs)} 個排程工作")
         for job in jobs:
             next_run = job.next_run_time.strftime('%Y/%m/%d %H:%M:%S') if job.next_run_time else "未設定"
-            job_name = "🌅 早安訊息" if job.id == "morning_message" else "📊 週報摘要" if job.id == "weekly_summary" else "⏰ 行程提醒檢查" if job.id == "pending_reminders" else job.id
+            job_name = "🌅 早安訊息" if job.id == "morning_message" else "📊 週報摘要" if job.id == "weekly_summary" else "⏰ 行程提醒檢查" if job.id == "pending_reminders" else "🗄️ 行程封存" if job.id == "schedule_compaction" else "⏰ 倒數計時接手" if job.id == "countdown_restore" else job.id
             print(f"   • {job_name}: 下次執行 {next_run}")
     except Exception as e:
         print(f"❌ 查看排程狀態失敗：{e}")
@@ -0,0 +1,197 @@
+"""效能基準測試：python benchmarks.py
+
+不需要 LINE 或 Google 的憑證，所有資料都寫入暫存的本地資料庫。
+"""
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("BOT_AUTOSTART", "0")
+os.environ.setdefault("BOT_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "benchmark")
+os.environ.setdefault("LINE_CHANNEL_SECRET", "benchmark")
+
+import app  # noqa: E402
+
+
+class _Source:
+    type = "group"
+    group_id = "Cbenchmark"
+    user_id = "Ubenchmark"
+
+
+class _Event:
+    source = _Source()
+    reply_token = "benchmark"
+
+
+def _timeit(func, items, repeat=5):
+    """回傳每秒處理筆數（取最佳一次）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def bench_command_router(n=20000):
+    """指令路由：一般聊天（應被快速略過）與完全吻合的指令"""
+    event = _Event()
+    chatter = ["今天天氣真好", "哈哈哈", "好喔", "晚點見", "OK", "👍", "等等要吃什麼？"] * (n // 7)
+    commands = ["hi", "哈囉", "你還會說什麼?", "HI"] * (n // 4)
+    dispatch = app.command_router.dispatch
+    print(f"command_router 聊天訊息：{_timeit(lambda text: dispatch(event, text, 'Cbenchmark'), chatter):,.0f} 則/秒")
+    print(f"command_router 完全吻合指令：{_timeit(lambda text: dispatch(event, text, 'Cbenchmark'), commands):,.0f} 則/秒")
+
+
+def _legacy_is_schedule_format(text):
+    """舊版行程格式檢查（多次 split 與逐段檢查），僅供比較"""
+    parts = text.strip().split()
+    if len(parts) < 2:
+        return False
+    date_part, time_part = parts[0], parts[1]
+    if "/" in date_part:
+        date_segments = date_part.split("/")
+        if len(date_segments) in (2, 3) and all(segment.isdigit() for segment in date_segments):
+            if ":" in time_part:
+                colon_index = time_part.find(":")
+                if colon_index > 0:
+                    time_only = time_part[:colon_index+3]
+                    if len(time_only) >= 4:
+                        time_segments = time_only.split(":")
+                        if len(time_segments) == 2 and all(segment.isdigit() for segment in time_segments):
+                            return True
+    return False
+
+
+def _legacy_parse_schedule(text):
+    """舊版 try_add_schedule 的解析部分（逐字掃描加 strptime），僅供比較"""
+    parts = text.strip().split()
+    date_part = parts[0]
+    time_and_content = " ".join(parts[1:])
+    colon_index = time_and_content.find(":")
+    time_start = max(0, colon_index - 2)
+    while time_start < colon_index and not time_and_content[time_start].isdigit():
+        time_start += 1
+    time_end = colon_index + 3
+    time_part = time_and_content[time_start:time_end]
+    content = time_and_content[time_end:].strip()
+    if date_part.count("/") == 1:
+        date_part = f"{datetime.now().year}/{date_part}"
+    return datetime.strptime(f"{date_part} {time_part}", "%Y/%m/%d %H:%M"), content
+
+
+def bench_schedule_parser(n=20000):
+    """行程文字解析：新版單次正規表示式比對 vs 舊版逐段檢查加 strptime"""
+    texts = ["7/1 14:00 開會", "12/25 09:30 聖誕聚餐", "2026/3/5 8:05看牙醫", "10/18 10:00 團隊 週會"] * (n // 4)
+
+    def legacy(text):
+        if _legacy_is_schedule_format(text):
+            _legacy_parse_schedule(text)
+
+    print(f"行程解析（舊版）：{_timeit(legacy, texts):,.0f} 則/秒")
+    print(f"行程解析（新版）：{_timeit(app.parse_schedule_text, texts):,.0f} 則/秒")
+
+
+def bench_sheet_datetime(n=20000):
+    """工作表日期時間欄位：strptime vs 固定格式解碼 vs 加上 LRU 快取"""
+    cells = [(f"2026/{m}/{d:02d}", f"{h:02d}:{m * 5:02d}") for m in range(1, 12) for d in range(1, 29) for h in range(0, 24, 6)]
+    cells = (cells * (n // len(cells) + 1))[:n]
+
+    def legacy(cell):
+        datetime.strptime(f"{cell[0]} {cell[1]}", "%Y/%m/%d %H:%M")
+
+    print(f"工作表日期解析（strptime）：{_timeit(legacy, cells):,.0f} 筆/秒")
+    print(f"工作表日期解析（固定格式）：{_timeit(lambda cell: app.parse_sheet_datetime.__wrapped__(*cell), cells):,.0f} 筆/秒")
+    app.parse_sheet_datetime.cache_clear()
+    print(f"工作表日期解析（快取）：{_timeit(lambda cell: app.parse_sheet_datetime(*cell), cells):,.0f} 筆/秒"
+          f"，命中率 {app.sheet_datetime_cache_stats()['hit_rate']:.0%}")
+
+
+def bench_reminder_planner(n=5000):
+    """尖峰時段的提醒發送規劃：逐筆推播 vs 合併後的 API 呼叫次數"""
+    contents = ["⏰ 溫馨提醒：一小時後有「週會」", "⏰ 溫馨提醒：一小時後有「讀書會」", "⏰ 溫馨提醒：一小時後有「吃藥」"]
+    recipients = [f"U{k:032x}" for k in range(n // 4)] + [f"C{k:032x}" for k in range(20)]
+    items = [(i, contents[i % len(contents)], recipients[i % len(recipients)]) for i in range(n)]
+    deliveries = app.plan_reminder_deliveries(items)
+    print(f"提醒發送規劃：{n:,} 則提醒 → {len(deliveries):,} 次 API 呼叫"
+          f"（{_timeit(app.plan_reminder_deliveries, [items], repeat=3):,.1f} 次規劃/秒）")
+
+
+def _legacy_render_schedule(schedules, period):
+    """舊版 get_schedule 的輸出迴圈（schedules.index 加字串串接），僅供比較"""
+    result = "🎯 明年行程\n━━━━━━━━━━━━━━━━\n\n"
+    current_date = None
+    weekday_names = ["一", "二", "三", "四", "五", "六", "日"]
+    for dt, content in schedules:
+        if current_date != dt.date():
+            current_date = dt.date()
+            if len(schedules) > 1 and period in ["this_week", "next_week", "this_month", "next_month", "next_year"]:
+                weekday = weekday_names[dt.weekday()]
+                result += f"📆 {dt.strftime('%m/%d')} (週{weekday})\n"
+                result += "─────────────────────\n"
+        result += f"🕐 {dt.strftime('%H:%M')} │ {content}\n"
+        if len(schedules) > 1 and period in ["this_week", "next_week", "this_month", "next_month", "next_year"]:
+            current_index = schedules.index((dt, content))
+            if current_index < len(schedules) - 1:
+                next_dt, _ = schedules[current_index + 1]
+                if next_dt.date() != dt.date():
+                    result += "\n"
+    result += "\n💡 記得提前準備，祝您順利完成所有安排！"
+    return result.rstrip()
+
+
+def bench_get_schedule(n=10000):
+    """明年行程 n 筆：舊版 O(n²) 輸出 vs 一次分組、join 後分頁"""
+    user_id = "Ubenchmarkschedule"
+    start = datetime(datetime.now().year + 1, 1, 1, 8, 0)
+    rows = []
+    for k in range(n):
+        dt = start + timedelta(hours=k * 7 // 8)
+        rows.append([dt.strftime("%Y/%m/%d"), dt.strftime("%H:%M"), f"行程 {k}", user_id, ""])
+    app.schedule_store.add_rows(rows)
+    schedules = app.schedule_index.query(user_id, start, start.replace(year=start.year + 1))
+    print(f"明年行程 {n:,} 筆（舊版輸出）：{1 / _timeit(lambda _: _legacy_render_schedule(schedules, 'next_year'), [None], repeat=1) * 1000:,.0f} ms")
+    elapsed = 1 / _timeit(lambda _: app.paginate_text(app.get_schedule("next_year", user_id)), [None])
+    pages = app.paginate_text(app.get_schedule("next_year", user_id))
+    print(f"明年行程 {n:,} 筆（新版輸出與分頁）：{elapsed * 1000:,.1f} ms，{len(pages)} 則訊息")
+
+
+def bench_schedule_reply_cache(n=2000):
+    """群組反覆查詢本月行程：每次重新組回覆 vs 回覆快取"""
+    user_id = "Ubenchmarkcache"
+    now = datetime.now()
+    start, end = app.period_range("this_month", now)
+    rows = []
+    for k in range(200):
+        dt = start + (end - start) * k / 200
+        rows.append([dt.strftime("%Y/%m/%d"), dt.strftime("%H:%M"), f"行程 {k}", user_id, ""])
+    app.schedule_store.add_rows(rows)
+    queries = [user_id] * n
+    print(f"本月行程查詢（重新組回覆）：{_timeit(lambda uid: app.render_schedule('this_month', uid, now), queries):,.0f} 次/秒")
+    print(f"本月行程查詢（回覆快取）：{_timeit(lambda uid: app.get_schedule('this_month', uid), queries):,.0f} 次/秒"
+          f"，命中率 {app.schedule_reply_cache.stats()['hit_rate']:.0%}")
+
+
+def bench_metrics(n=100000):
+    """監控指標的額外負擔：Histogram.observe 與 Counter.inc"""
+    histogram = app.Histogram("benchmark_seconds", "benchmark")
+    counter = app.Counter("benchmark_total", "benchmark")
+    values = [k / n for k in range(n)]
+    print(f"Histogram.observe：{_timeit(lambda v: histogram.observe(v, operation='get'), values):,.0f} 次/秒")
+    print(f"Counter.inc：{_timeit(lambda v: counter.inc(outcome='success'), values):,.0f} 次/秒")
+    app.metrics_registry.remove(histogram)
+    app.metrics_registry.remove(counter)
+
+
+if __name__ == "__main__":
+    bench_command_router()
+    bench_schedule_parser()
+    bench_sheet_datetime()
+    bench_reminder_planner()
+    bench_get_schedule()
+    bench_schedule_reply_cache()
+    bench_metrics()
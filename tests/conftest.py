@@ -0,0 +1,136 @@
+"""測試共用設定：不需要 LINE 或 Google 的憑證，試算表以記憶體中的假工作表代替"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_AUTOSTART", "0")
+os.environ.setdefault("BOT_DB_PATH", os.path.join(tempfile.mkdtemp(), "test.db"))
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "test")
+os.environ.setdefault("LINE_CHANNEL_SECRET", "test")
+
+import app  # noqa: E402
+
+HEADER = ["日期", "時間", "內容", "使用者", "狀態"]
+
+
+def _column_index(letters):
+    return ord(letters) - ord("A")
+
+
+class FakeWorksheet:
+    """只實作同步與封存用到的 gspread 方法，行為比照 Sheets API（結尾空白儲存格與空白列不回傳）"""
+
+    title = "Sheet1"
+
+    def __init__(self, rows=None):
+        self.rows = [list(row) for row in rows] if rows is not None else [list(HEADER)]
+        self.fail_on = set()
+        self.fail_after = set()  # 請求已套用但回傳錯誤（例如回應逾時）
+        self.reads = 0
+        self.stale_modified = None
+
+    def _check(self, name):
+        if name in self.fail_on:
+            raise RuntimeError(f"{name} failed")
+
+    def _cell(self, row, col, value):
+        while len(self.rows) < row:
+            self.rows.append([])
+        cells = self.rows[row - 1]
+        while len(cells) < col:
+            cells.append("")
+        cells[col - 1] = value
+
+    @property
+    def spreadsheet(self):
+        return self
+
+    def get_lastUpdateTime(self):
+        # Drive 的修改時間在任何儲存格變動後都會改變，這裡以內容代替；stale_modified 模擬修改時間尚未更新
+        if self.stale_modified is not None:
+            return self.stale_modified
+        return json.dumps(self.rows, ensure_ascii=False)
+
+    def _values(self, range_name):
+        if ":" not in range_name:
+            range_name = f"{range_name}:{range_name}"
+        first_col, first_row, last_col, last_row = re.fullmatch(r"([A-Z])(\d+):([A-Z])(\d+)", range_name).groups()
+        start, stop = _column_index(first_col), _column_index(last_col) + 1
+        result = []
+        for cells in self.rows[int(first_row) - 1:int(last_row)]:
+            cells = cells[start:stop]
+            while cells and not cells[-1]:
+                cells.pop()
+            result.append(cells)
+        while result and not result[-1]:
+            result.pop()
+        return result
+
+    def get(self, range_name):
+        self._check("get")
+        self.reads += 1
+        return self._values(range_name)
+
+    def batch_get(self, ranges, **kwargs):
+        self._check("batch_get")
+        self.reads += 1
+        return [self._values(range_name) for range_name in ranges]
+
+    def col_values(self, col):
+        self._check("col_values")
+        self.reads += 1
+        values = [cells[col - 1] if len(cells) >= col else "" for cells in self.rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def append_rows(self, rows, **kwargs):
+        self._check("append_rows")
+        first_row = len(self.rows) + 1
+        self.rows.extend(list(row) for row in rows)
+        if "append_rows" in self.fail_after:
+            self.fail_after.discard("append_rows")
+            raise RuntimeError("append_rows timed out")
+        return {"updates": {"updatedRange": f"{self.title}!A{first_row}:F{len(self.rows)}"}}
+
+    def batch_update(self, data, **kwargs):
+        self._check("batch_update")
+        for item in data:
+            col, row = re.fullmatch(r"([A-Z])(\d+)", item["range"]).groups()
+            self._cell(int(row), _column_index(col) + 1, item["values"][0][0])
+
+    def update(self, values, range_name, **kwargs):
+        self._check("update")
+        first_row = int(re.match(r"A(\d+)", range_name).group(1))
+        for offset, cells in enumerate(values):
+            for col, value in enumerate(cells, start=1):
+                self._cell(first_row + offset, col, value)
+
+    def hide_columns(self, start, end):
+        self._check("hide_columns")
+
+    def data_rows(self):
+        """去掉標題與識別碼欄後的資料列"""
+        return [(cells + [""] * 5)[:5] for cells in self.rows[1:] if any(cells)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "bot.db"
+    return app.ScheduleStore(connect=lambda: sqlite3.connect(path, timeout=30))
+
+
+@pytest.fixture
+def worksheet():
+    return FakeWorksheet()
+
+
+@pytest.fixture
+def replicator(store, worksheet):
+    return app.SheetReplicator(store, worksheet, retries=1)
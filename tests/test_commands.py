@@ -0,0 +1,92 @@
+import types
+
+import app
+
+
+def _event(group_id):
+    return types.SimpleNamespace(source=types.SimpleNamespace(type="group", group_id=group_id, user_id="Uother"))
+
+
+def test_weekly_summary_command_does_not_reply_with_other_chats_schedules(monkeypatch):
+    pushed = []
+    monkeypatch.setattr(app, "manual_weekly_summary", lambda: pushed.append(True))
+    monkeypatch.setattr(app.weekly_digest, "message", lambda: "Cgroupaaaa 的下週行程")
+
+    reply = app.command_router.dispatch(_event("Cotherchat"), "測試週報", "Uother")
+
+    assert pushed
+    assert "Cgroupaaaa" not in reply
+
+
+def test_help_lists_the_configured_reminder_lead_times(monkeypatch):
+    monkeypatch.setattr(app, "REMINDER_LEAD_TIMES", app.parse_lead_times("1d,10m"))
+
+    assert app.send_help_message().endswith("系統會在行程前一天、10分鐘自動提醒您！")
+
+
+def _user_event(user_id="Uuser"):
+    return types.SimpleNamespace(source=types.SimpleNamespace(type="user", user_id=user_id))
+
+
+def _dispatch(text, user_id="Uuser"):
+    return app.command_router.dispatch(_user_event(user_id), text, user_id)
+
+
+def test_exact_commands_reply_like_before(monkeypatch):
+    queries, countdowns = [], []
+    monkeypatch.setattr(app, "get_schedule", lambda period, user_id: queries.append((period, user_id)) or "行程")
+    monkeypatch.setattr(app, "start_countdown", lambda user_id, minutes: countdowns.append((user_id, minutes)))
+
+    assert _dispatch("今日行程") == "行程"
+    assert _dispatch("下個月行程") == "行程"
+    assert queries == [("today", "Uuser"), ("next_month", "Uuser")]
+    assert _dispatch("倒數計時").startswith("⏰ 3分鐘倒數計時開始！")
+    assert _dispatch("倒數5分鐘").startswith("⏰ 5分鐘倒數計時開始！")
+    assert countdowns == [("Uuser", 3), ("Uuser", 5)]
+    assert _dispatch("哈囉") == "🙋‍♀️ 怎樣？有什麼需要幫忙的嗎？"
+    assert _dispatch("你還會說什麼?").startswith("💕 我愛你")
+    assert _dispatch("說明") == _dispatch("HELP") == app.send_help_message()
+    assert _dispatch("查看id").endswith("💬 環境：個人對話")
+    assert _dispatch("設定早安群組") == "❌ 此指令只能在群組中使用"
+
+
+def test_hi_is_case_insensitive():
+    assert _dispatch("hi") == _dispatch("HI") == _dispatch("Hi") == "👋 呷飽沒？需要安排什麼行程嗎？"
+
+
+def test_lottery():
+    picked = _dispatch("抽2").split("、")
+    assert len(picked) == 2 and set(picked) <= set(app.LOTTERY_NAMES)
+    assert _dispatch("抽5") == "請輸入抽1到抽3"
+    assert _dispatch("抽a") is None
+
+
+def test_ranking(monkeypatch):
+    submitted = []
+    buffer = types.SimpleNamespace(submit=lambda rows: submitted.extend(rows) or "future", wait=lambda future: True)
+    monkeypatch.setattr(app, "ranking_buffer", buffer)
+
+    assert _dispatch("風雲榜").startswith("📊 風雲榜資料輸入說明")
+    text = "奕君,惠華\n離世傳心練習\n6/25\n傳心\n9\n10\n10\n10\n嘉憶家的莎莉"
+    assert _dispatch(text) == "✅ 已成功寫入工作表2"
+    assert [row[0] for row in submitted] == ["奕君", "惠華"]
+    assert submitted[0][1:] == ["離世傳心練習", "6/25", "", "傳心", "9", "10", "10", "10", "嘉憶家的莎莉"]
+
+
+def test_schedule_text(monkeypatch):
+    added = []
+    monkeypatch.setattr(app.schedule_store, "add_rows", lambda rows: added.extend(rows))
+    monkeypatch.setattr(app.weekly_digest, "refresh", lambda: None)
+
+    reply = _dispatch("2099/12/25 09:00 聖誕節聚餐")
+
+    assert reply.startswith("✅ 行程新增成功！")
+    assert "📝 內容：聖誕節聚餐" in reply
+    assert added[0] == ["2099/12/25", "09:00", "聖誕節聚餐", "Uuser", ""]
+    assert _dispatch("7/1 14:00").startswith("❌ 時間格式錯誤")
+    assert _dispatch("2020/1/1 09:00 過去").startswith("❌ 無法新增過去的時間")
+
+
+def test_ordinary_chatter_gets_no_reply():
+    for text in ["今天天氣真好", "hello", "123", "12 點見", "抽", "風雲榜怎麼用", "a\nb"]:
+        assert _dispatch(text) is None, text
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+import pytest
+
+import app
+from conftest import FakeWorksheet
+
+NOW = datetime(2026, 12, 31, 3, 0)
+
+
+@pytest.fixture
+def archive_worksheet():
+    return FakeWorksheet([])
+
+
+@pytest.fixture
+def compactor(store, replicator, archive_worksheet):
+    return app.ScheduleCompactor(store, replicator, archive_worksheet, retention_days=40)
+
+
+@pytest.fixture
+def schedules(store, replicator):
+    store.add_rows([
+        ("2026/10/01", "09:00", "old sent", "u1", "已發送"),
+        ("2026/10/01", "10:00", "old pending", "u1", "待發送"),
+        ("2026/12/30", "09:00", "recent", "u1", "已發送"),
+        ("2026/10/02", "09:00", "old plain", "u2", ""),
+    ])
+    replicator.push_changes()
+
+
+def _archived(store):
+    with store.connect() as conn:
+        return sorted(row[0] for row in conn.execute("SELECT content FROM schedule_archive"))
+
+
+@pytest.mark.usefixtures("schedules")
+def test_compaction_moves_old_rows_out(store, worksheet, archive_worksheet, compactor):
+    report = compactor.compact(NOW)
+
+    assert report["moved"] == 2
+    assert (report["sheet_rows_before"], report["sheet_rows_after"]) == (4, 2)
+    assert worksheet.data_rows() == [
+        ["2026/10/01", "10:00", "old pending", "u1", "待發送"],
+        ["2026/12/30", "09:00", "recent", "u1", "已發送"],
+    ]
+    assert sorted(cells[2] for cells in archive_worksheet.rows) == ["old plain", "old sent"]
+    assert _archived(store) == ["old plain", "old sent"]
+    with store.connect() as conn:
+        assert conn.execute("SELECT content, sheet_row FROM schedules ORDER BY sheet_row").fetchall() == [
+            ("old pending", 2), ("recent", 3)
+        ]
+
+
+@pytest.mark.usefixtures("schedules")
+def test_kept_rows_keep_syncing_after_compaction(store, worksheet, replicator, compactor):
+    compactor.compact(NOW)
+
+    with store.connect() as conn:
+        row_id = conn.execute("SELECT id FROM schedules WHERE content = 'old pending'").fetchone()[0]
+    assert store.claim(row_id)
+    assert store.confirm(row_id, "已發送")
+    replicator.pull_changes()
+    replicator.push_changes()
+
+    assert worksheet.data_rows()[0] == ["2026/10/01", "10:00", "old pending", "u1", "已發送"]
+    assert replicator.conflict_count == 0
+
+
+@pytest.mark.usefixtures("schedules")
+def test_failed_rewrite_does_not_duplicate_archive_rows(store, worksheet, archive_worksheet, compactor):
+    worksheet.fail_on.add("update")
+    assert compactor.compact(NOW) is None
+    # 封存工作表已寫入，但試算表與熱資料表都還沒變
+    assert len(archive_worksheet.rows) == 2
+    assert len(worksheet.data_rows()) == 4
+
+    worksheet.fail_on.clear()
+    report = compactor.compact(NOW)
+
+    assert report["moved"] == 2
+    assert sorted(cells[2] for cells in archive_worksheet.rows) == ["old plain", "old sent"]
+    assert _archived(store) == ["old plain", "old sent"]
+    assert len(worksheet.data_rows()) == 2
+
+
+@pytest.mark.usefixtures("schedules")
+def test_failed_archive_append_is_retried(store, worksheet, archive_worksheet, compactor):
+    archive_worksheet.fail_on.add("append_rows")
+    assert compactor.compact(NOW) is None
+    assert len(worksheet.data_rows()) == 4
+
+    archive_worksheet.fail_on.clear()
+    compactor.compact(NOW)
+
+    assert sorted(cells[2] for cells in archive_worksheet.rows) == ["old plain", "old sent"]
+    assert len(worksheet.data_rows()) == 2
+
+
+@pytest.mark.usefixtures("schedules")
+def test_rows_with_unsynced_changes_are_not_archived(store, compactor, monkeypatch):
+    with store.connect() as conn:
+        conn.execute("UPDATE schedules SET dirty = 1 WHERE content = 'old sent'")
+    # 模擬寫回失敗：本地修改尚未同步到試算表
+    monkeypatch.setattr(compactor.replicator, "push_changes", lambda: None)
+
+    report = compactor.compact(NOW)
+
+    assert report["moved"] == 1
+    assert _archived(store) == ["old plain"]
+
+
+def _registered_jobs(monkeypatch, archive_worksheet):
+    monkeypatch.setattr(app, "scheduler", app.BackgroundScheduler())
+    monkeypatch.setattr(app.schedule_compactor, "archive_worksheet", archive_worksheet)
+    app.register_scheduled_jobs()
+    return {job.id for job in app.scheduler.get_jobs()}
+
+
+def test_compaction_job_needs_an_archive_worksheet(monkeypatch):
+    assert "schedule_compaction" not in _registered_jobs(monkeypatch, None)
+    assert "schedule_compaction" in _registered_jobs(monkeypatch, FakeWorksheet([]))
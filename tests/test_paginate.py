@@ -0,0 +1,49 @@
+import random
+
+import app
+
+
+def _lengths(pages):
+    return [app.text_length(page) for page in pages]
+
+
+def test_short_text_is_one_page():
+    assert app.paginate_text("今日行程\n09:00 開會") == ["今日行程\n09:00 開會"]
+
+
+def test_cut_at_blank_line_still_respects_the_limit():
+    text = "\n".join(["a" * 10, "", "b" * 4900, "c" * 200])
+
+    pages = app.paginate_text(text)
+
+    assert max(_lengths(pages)) <= app.LINE_MAX_TEXT_LENGTH
+    assert "\n".join(pages).replace("\n", "") == text.replace("\n", "")
+
+
+def test_schedule_shaped_text_never_exceeds_the_limit():
+    rng = random.Random(0)
+    for _ in range(300):
+        lines = []
+        for _ in range(rng.randint(1, 400)):
+            if rng.random() < 0.15:
+                lines.append("")
+            else:
+                lines.append("📅 " + "行" * rng.randint(1, 80))
+        text = "\n".join(lines)
+        if not text.strip():
+            continue
+
+        pages = app.paginate_text(text, limit=1000)
+
+        assert len(pages) <= app.LINE_MAX_MESSAGES
+        assert max(_lengths(pages)) <= 1000
+
+
+def test_overlong_text_is_truncated_with_a_note():
+    text = "\n".join("📅 " + "行" * 70 for _ in range(2000))
+
+    pages = app.paginate_text(text)
+
+    assert len(pages) == app.LINE_MAX_MESSAGES
+    assert max(_lengths(pages)) <= app.LINE_MAX_TEXT_LENGTH
+    assert pages[-1].endswith("請改查詢較短的期間")
@@ -0,0 +1,120 @@
+"""PushDispatcher 對本機的 LINE API 模擬伺服器推播"""
+import collections
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage
+
+import app
+
+
+class StubLineHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("X-Line-Retry-Key"), body))
+            status = server.statuses.popleft() if server.statuses else 200
+        payload = json.dumps({} if status == 200 else {"message": f"status {status}"}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def line_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLineHandler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.statuses = collections.deque()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dispatcher(line_server, monkeypatch):
+    # 重試之間不等待
+    monkeypatch.setattr(app.time, "sleep", lambda seconds: None)
+    endpoint = f"http://127.0.0.1:{line_server.server_port}"
+    return app.PushDispatcher(lambda: LineBotApi("test", endpoint=endpoint), workers=1, max_retries=2)
+
+
+def _message(text="hello"):
+    return [TextSendMessage(text=text)]
+
+
+def test_push_succeeds(line_server, dispatcher):
+    assert dispatcher.push("U1", _message()).result(timeout=5) is None
+
+    [(path, retry_key, body)] = line_server.requests
+    assert path == "/v2/bot/message/push"
+    assert retry_key
+    assert body["to"] == "U1"
+    assert body["messages"] == [{"type": "text", "text": "hello"}]
+    assert dispatcher.sent_count == 1
+
+
+def test_rate_limited_and_server_errors_are_retried_with_the_same_retry_key(line_server, dispatcher):
+    line_server.statuses.extend([429, 500])
+
+    assert dispatcher.push("U1", _message(), retry_key="key-1").result(timeout=5) is None
+
+    assert [retry_key for _, retry_key, _ in line_server.requests] == ["key-1"] * 3
+
+
+def test_conflict_means_the_retry_key_was_already_accepted(line_server, dispatcher):
+    line_server.statuses.append(409)
+
+    assert dispatcher.push("U1", _message(), retry_key="key-1").result(timeout=5) is None
+
+    assert len(line_server.requests) == 1
+    assert dispatcher.failed_count == 0
+
+
+def test_exhausted_retries_fail_the_future(line_server, dispatcher):
+    line_server.statuses.extend([500] * 3)
+
+    error = dispatcher.push("U1", _message()).exception(timeout=5)
+
+    assert isinstance(error, LineBotApiError) and error.status_code == 500
+    assert len(line_server.requests) == 3
+    assert dispatcher.failed_count == 1
+
+
+def test_client_errors_are_not_retried(line_server, dispatcher):
+    line_server.statuses.append(400)
+
+    assert dispatcher.push("U1", _message()).exception(timeout=5).status_code == 400
+    assert len(line_server.requests) == 1
+
+
+def test_multicast_uses_the_multicast_api(line_server, dispatcher):
+    assert dispatcher.multicast(["U1", "U2"], _message(), retry_key="key-1").result(timeout=5) is None
+
+    [(path, retry_key, body)] = line_server.requests
+    assert (path, retry_key, body["to"]) == ("/v2/bot/message/multicast", "key-1", ["U1", "U2"])
+
+
+def test_concurrent_pushes_keep_their_own_retry_keys(line_server):
+    endpoint = f"http://127.0.0.1:{line_server.server_port}"
+    dispatcher = app.PushDispatcher(lambda: LineBotApi("test", endpoint=endpoint), workers=4)
+
+    futures = [dispatcher.push(f"U{n}", _message(), retry_key=f"key-{n}") for n in range(20)]
+    for future in futures:
+        assert future.result(timeout=5) is None
+
+    assert sorted((body["to"], retry_key) for _, retry_key, body in line_server.requests) == sorted(
+        (f"U{n}", f"key-{n}") for n in range(20)
+    )
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+import app
+from conftest import FakeWorksheet
+
+
+@pytest.fixture
+def ranking_sheet():
+    return FakeWorksheet([])
+
+
+@pytest.fixture
+def buffer(tmp_path, ranking_sheet):
+    path = tmp_path / "bot.db"
+    # 時間窗設得很長，背景執行緒不會自己寫入，由測試呼叫 flush()
+    return app.RankingWriteBuffer(ranking_sheet, window=3600, max_rows=10 ** 6, connect=lambda: sqlite3.connect(path))
+
+
+def _buffered(buffer):
+    with buffer.connect() as conn:
+        return conn.execute("SELECT COUNT(*) FROM ranking_buffer").fetchone()[0]
+
+
+def test_transient_failure_keeps_rows_for_retry(buffer, ranking_sheet):
+    future = buffer.submit([["奕君", "傳心"], ["惠華", "傳心"]])
+    ranking_sheet.fail_on.add("append_rows")
+
+    assert buffer.flush() == 2
+    assert not future.done()
+    assert _buffered(buffer) == 2
+
+    ranking_sheet.fail_on.clear()
+    assert buffer.flush() == 0
+
+    assert future.result(timeout=0) is True
+    assert ranking_sheet.rows == [["奕君", "傳心"], ["惠華", "傳心"]]
+    assert _buffered(buffer) == 0
+
+
+def test_rows_are_dropped_after_the_retry_cap(buffer, ranking_sheet, monkeypatch):
+    monkeypatch.setattr(app, "RANKING_FLUSH_RETRIES", 3)
+    future = buffer.submit([["奕君", "傳心"]])
+    ranking_sheet.fail_on.add("append_rows")
+
+    assert [buffer.flush() for _ in range(3)] == [1, 1, 0]
+
+    assert future.result(timeout=0) is False
+    assert _buffered(buffer) == 0
+
+
+def test_timed_out_submission_is_cancelled(buffer, ranking_sheet):
+    future = buffer.submit([["奕君", "傳心"]])
+
+    assert buffer.wait(future, timeout=0.01) is False
+    buffer.flush()
+
+    assert ranking_sheet.rows == []
+    assert _buffered(buffer) == 0
+
+
+def test_cancel_after_the_write_reports_success(buffer, ranking_sheet):
+    future = buffer.submit([["奕君", "傳心"]])
+    buffer.flush()
+
+    assert buffer.cancel(future) is True
+    assert ranking_sheet.rows == [["奕君", "傳心"]]
@@ -0,0 +1,213 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import app
+
+
+def _add_reminder(store):
+    return store.add_rows([("2026/10/01", "10:00", "remB", "u1", "待發送")])[0]
+
+
+def _status(store, row_id):
+    with store.connect() as conn:
+        return conn.execute("SELECT status, claim_owner, dirty FROM schedules WHERE id = ?", (row_id,)).fetchone()
+
+
+def test_retry_keys_are_stable_per_database_but_not_across_databases(store, tmp_path):
+    reopened = app.ScheduleStore(connect=store.connect)
+    # 重建的資料庫 id 從 1 重新開始，retry key 不能跟舊資料庫重複
+    recreated = app.ScheduleStore(connect=lambda: sqlite3.connect(tmp_path / "recreated.db"))
+
+    assert store.retry_key([2, 1]) == reopened.retry_key([1, 2])
+    assert store.retry_key([1, 2]) != recreated.retry_key([1, 2])
+
+
+def test_claim_is_exclusive_and_confirm_ends_it(store):
+    row_id = _add_reminder(store)
+
+    assert store.claim(row_id)
+    assert not store.claim(row_id)
+    assert store.pending_reminders() == []
+    assert store.confirm(row_id, "已發送 10:00")
+
+    assert _status(store, row_id) == ("已發送 10:00", None, 1)
+    assert not store.claim(row_id)
+
+
+def test_expired_lease_can_be_reclaimed_and_the_old_owner_cannot_confirm(store, monkeypatch):
+    row_id = _add_reminder(store)
+    assert store.claim(row_id, lease_seconds=-1)
+    assert [row[0] for row in store.expired_claims()] == [row_id]
+
+    monkeypatch.setattr(app, "PROCESS_ID", "other-process")
+    assert store.claim(row_id)
+    assert store.expired_claims() == []
+    monkeypatch.undo()
+
+    assert not store.confirm(row_id, "已發送 10:00")
+    assert _status(store, row_id) == ("發送中", "other-process", 0)
+
+
+def test_renewed_lease_is_not_reclaimed(store, monkeypatch):
+    row_id = _add_reminder(store)
+    assert store.claim(row_id, lease_seconds=-1)
+
+    assert store.renew([row_id]) == 1
+    assert store.expired_claims() == []
+    monkeypatch.setattr(app, "PROCESS_ID", "other-process")
+    assert not store.claim(row_id)
+    assert store.renew([row_id]) == 0
+
+
+def test_lease_is_extended_while_the_push_is_queued(store, monkeypatch):
+    monkeypatch.setattr(app, "schedule_store", store)
+    monkeypatch.setattr(app, "REMINDER_LEASE_SECONDS", 0.3)
+    row_id = _add_reminder(store)
+    assert store.claim(row_id, lease_seconds=0.3)
+    future = Future()
+    threading.Timer(0.6, future.set_result, [None]).start()
+
+    app.wait_for_delivery(future, [row_id])
+
+    assert store.expired_claims() == []
+    assert store.confirm(row_id, "已發送 10:00")
+
+
+def _queue(store):
+    store.add_rows([
+        ("2026/10/01", "09:00", "missed", "u1", "待發送"),
+        ("2026/10/01", "09:50", "late", "u1", "待發送"),
+        ("2026/10/01", "10:00", "due", "u1", "待發送"),
+        ("2026/10/01", "10:05", "future", "u1", "待發送"),
+        ("2026/10/01", "08:00", "event", "u1", ""),
+    ])
+    reminder_queue = app.ReminderQueue(store)
+    reminder_queue.ensure_loaded()
+    return reminder_queue
+
+
+def test_pop_due_catches_up_within_the_window_and_expires_older_reminders(store):
+    reminder_queue = _queue(store)
+
+    due, expired = reminder_queue.pop_due(datetime(2026, 10, 1, 10, 0), catchup=timedelta(minutes=30))
+
+    assert [item[2] for item in due] == ["late", "due"]
+    assert [item[2] for item in expired] == ["missed"]
+    assert len(reminder_queue) == 1
+    assert reminder_queue.next_due() == datetime(2026, 10, 1, 10, 5)
+
+
+def test_requeued_reminders_are_held_until_the_retry_delay(store):
+    reminder_queue = _queue(store)
+    now = datetime(2026, 10, 1, 10, 0)
+    due, _ = reminder_queue.pop_due(now, catchup=timedelta(minutes=30))
+
+    reminder_queue.requeue(due, delay=60)
+
+    assert reminder_queue.next_due() > datetime.now()
+    again, _ = reminder_queue.pop_due(now, catchup=timedelta(minutes=30))
+    assert again == due
+    assert reminder_queue.next_due() == datetime(2026, 10, 1, 10, 5)
+
+
+def test_non_leader_timer_drops_its_queue_instead_of_sending(store, monkeypatch):
+    monkeypatch.setattr(app.leader_elector, "is_leader", False)
+    reminder_queue = _queue(store)
+    sent = []
+    timer = app.ReminderTimer(reminder_queue, lambda: sent.append(True))
+
+    timer.start()
+    deadline = time.monotonic() + 2
+    while len(reminder_queue) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(reminder_queue) == 0
+    assert reminder_queue.next_due() is None
+    assert not sent
+
+
+def test_wake_channel_notifies_the_listener(tmp_path):
+    channel = app.ReminderWakeChannel(str(tmp_path / "wake.sock"))
+    woken = threading.Event()
+    channel.listen(woken.set)
+
+    app.ReminderWakeChannel(channel.path).notify()
+
+    assert woken.wait(2)
+    channel.close()
+
+
+def test_planner_bundles_up_to_five_messages_per_recipient():
+    items = [(n, f"提醒 {n}", "U1") for n in range(1, 8)]
+
+    deliveries = app.plan_reminder_deliveries(items)
+
+    assert [(method, to, len(contents), row_ids) for method, to, contents, row_ids in deliveries] == [
+        ("push", "U1", 5, [1, 2, 3, 4, 5]),
+        ("push", "U1", 2, [6, 7]),
+    ]
+
+
+def test_planner_splits_multicasts_at_500_recipients():
+    items = [(n, "同樣的提醒", f"U{n}") for n in range(1201)]
+
+    deliveries = app.plan_reminder_deliveries(items)
+
+    assert [(method, len(to)) for method, to, _, _ in deliveries] == [
+        ("multicast", 500), ("multicast", 500), ("multicast", 201)
+    ]
+    assert all(contents == ("同樣的提醒",) for _, _, contents, _ in deliveries)
+
+
+def test_planner_always_pushes_to_groups_and_rooms():
+    items = [(1, "同樣的提醒", "Cgroup"), (2, "同樣的提醒", "Rroom"), (3, "同樣的提醒", "Cother")]
+
+    deliveries = app.plan_reminder_deliveries(items)
+
+    assert sorted((method, to) for method, to, _, _ in deliveries) == [
+        ("push", "Cgroup"), ("push", "Cother"), ("push", "Rroom")
+    ]
+
+
+def test_planner_delivers_every_row_exactly_once():
+    items = [(n, f"提醒 {n % 3}", f"U{n % 4}") for n in range(40)]
+    items += [(100 + n, "提醒 0", "Cgroup") for n in range(7)]
+    items += [(200 + n, "提醒 0", f"U{1000 + n}") for n in range(600)]
+
+    deliveries = app.plan_reminder_deliveries(items)
+
+    row_ids = [row_id for _, _, _, ids in deliveries for row_id in ids]
+    assert sorted(row_ids) == sorted(row_id for row_id, _, _ in items)
+    by_row = {row_id: (content, user_id) for row_id, content, user_id in items}
+    for method, to, contents, ids in deliveries:
+        assert len(contents) <= app.LINE_MAX_MESSAGES
+        recipients = [to] if method == "push" else to
+        assert len(recipients) <= app.LINE_MULTICAST_MAX
+        # 每一列都送給它自己的收件者，而且內容在這次推播的訊息中
+        assert all(by_row[row_id][1] in recipients and by_row[row_id][0] in contents for row_id in ids)
+
+
+def test_failed_load_holds_the_queue_instead_of_retrying_immediately(store, monkeypatch):
+    monkeypatch.setattr(app.leader_elector, "is_leader", True)
+    reminder_queue = _queue(store)
+    calls = []
+
+    def send():
+        calls.append(True)
+        try:
+            reminder_queue.ensure_loaded()
+        except sqlite3.DatabaseError:
+            pass
+
+    def broken_version():
+        raise sqlite3.DatabaseError("disk I/O error")
+
+    monkeypatch.setattr(store, "version", broken_version)
+    app.ReminderTimer(reminder_queue, send).start()
+    time.sleep(0.5)
+
+    assert len(calls) == 1
+    assert reminder_queue.next_due() > datetime.now()
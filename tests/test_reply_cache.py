@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def cache(store):
+    return app.ScheduleReplyCache(app.ScheduleIndex(store))
+
+
+class Renderer:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return f"reply {self.calls}"
+
+
+def _bucket(period, now):
+    return app.period_range(period, now)[0]
+
+
+def test_adding_a_schedule_for_the_same_user_invalidates_its_replies(store, cache):
+    render = Renderer()
+    bucket = _bucket("this_week", datetime(2026, 10, 14, 12, 0))
+
+    assert cache.get("Uuser", "this_week", bucket, render) == "reply 1"
+    assert cache.get("UUSER", "this_week", bucket, render) == "reply 1"
+    store.add_rows([("2026/10/15", "10:00", "新行程", "Uuser", "")])
+
+    assert cache.get("Uuser", "this_week", bucket, render) == "reply 2"
+    assert cache.stats()["hits"] == 1
+
+
+def test_adding_a_schedule_for_another_user_keeps_the_cached_reply(store, cache):
+    render = Renderer()
+    bucket = _bucket("today", datetime(2026, 10, 14, 12, 0))
+    cache.get("Uuser", "today", bucket, render)
+
+    store.add_rows([("2026/10/14", "18:00", "別人的行程", "Uother", "")])
+
+    assert cache.get("Uuser", "today", bucket, render) == "reply 1"
+    assert render.calls == 1
+
+
+def test_day_and_week_rollover_change_the_bucket(cache):
+    render = Renderer()
+    before_midnight = datetime(2026, 10, 18, 23, 59)  # 週日
+    after_midnight = datetime(2026, 10, 19, 0, 1)     # 週一
+
+    assert _bucket("this_week", datetime(2026, 10, 14, 12, 0)) == _bucket("this_week", before_midnight)
+    for period in ("today", "tomorrow", "this_week", "next_week"):
+        assert _bucket(period, before_midnight) != _bucket(period, after_midnight)
+
+    cache.get("Uuser", "today", _bucket("today", before_midnight), render)
+    assert cache.get("Uuser", "today", _bucket("today", after_midnight), render) == "reply 2"
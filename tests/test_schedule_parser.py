@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+
+import app
+
+NOW = datetime(2026, 10, 16, 12, 0)
+
+
+def test_parses_month_day_and_full_dates():
+    assert app.parse_schedule_text("7/1 14:00 開會", NOW) == (datetime(2026, 7, 1, 14, 0), "開會")
+    assert app.parse_schedule_text("2027/1/5 9:05客戶  會議", NOW) == (datetime(2027, 1, 5, 9, 5), "客戶 會議")
+    # 全形空白和舊版一樣視為分隔
+    assert app.parse_schedule_text("7/1\u300014:00\u3000開會", NOW) == (datetime(2026, 7, 1, 14, 0), "開會")
+
+
+def test_format_errors():
+    with pytest.raises(app.ScheduleParseError) as error:
+        app.parse_schedule_text("7/1 14:00", NOW)
+    assert error.value.reason == "format"
+    with pytest.raises(app.ScheduleParseError) as error:
+        app.parse_schedule_text("2/30 14:00 開會", NOW)
+    assert error.value.reason == "value"
+
+
+@pytest.mark.parametrize("text", [
+    "２/１ １０:００ 開會",      # 全形數字
+    "7/1 １4:00 開會",
+    "٧/١ 14:00 開會",           # 阿拉伯-印度數字
+    "²/1 14:00 開會",           # 上標數字
+])
+def test_non_ascii_digits_are_not_schedules(text):
+    assert app.parse_schedule_text(text, NOW) is None
+
+
+def test_non_ascii_digits_get_no_reply():
+    for text in ["２/１ １０:００ 開會", "²/1 14:00 開會", "² 開會"]:
+        assert app.command_router.dispatch(None, text, "Uuser") is None
@@ -0,0 +1,292 @@
+import pytest
+
+import app
+from conftest import HEADER, FakeWorksheet
+
+
+def _rows(store):
+    with store.connect() as conn:
+        return {
+            row[0]: row[1:]
+            for row in conn.execute("SELECT content, status, sheet_row, dirty FROM schedules")
+        }
+
+
+def _key(store, row_id):
+    return f"{row_id}@{store.instance_id}"
+
+
+def _send(store, content, status="已發送"):
+    with store.connect() as conn:
+        row_id = conn.execute("SELECT id FROM schedules WHERE content = ?", (content,)).fetchone()[0]
+    assert store.claim(row_id)
+    assert store.confirm(row_id, status)
+
+
+def test_push_appends_new_rows_with_ids(store, worksheet, replicator):
+    ids = store.add_rows([
+        ("2026/10/01", "09:00", "A", "u1", "已發送"),
+        ("2026/10/01", "10:00", "B", "u1", "待發送"),
+    ])
+
+    replicator.push_changes()
+
+    assert worksheet.rows[1:] == [
+        ["2026/10/01", "09:00", "A", "u1", "已發送", _key(store, ids[0])],
+        ["2026/10/01", "10:00", "B", "u1", "待發送", _key(store, ids[1])],
+    ]
+    assert _rows(store) == {"A": ("已發送", 2, 0), "B": ("待發送", 3, 0)}
+
+
+def test_append_that_failed_after_applying_is_not_repeated(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "remB", "u1", "待發送")])
+    worksheet.fail_after.add("append_rows")
+
+    with pytest.raises(RuntimeError):
+        replicator.push_changes()
+    replicator.push_changes()
+    replicator.pull_changes()
+
+    assert worksheet.data_rows() == [["2026/10/01", "10:00", "remB", "u1", "待發送"]]
+    assert _rows(store) == {"remB": ("待發送", 2, 0)}
+    assert len(store.pending_reminders()) == 1
+
+
+def test_new_leader_checks_an_append_that_may_have_landed(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "remB", "u1", "待發送")])
+    worksheet.fail_after.add("append_rows")
+    with pytest.raises(RuntimeError):
+        replicator.push_changes()
+
+    # 重啟或換 leader 後的新 replicator 沒有先前的記憶
+    app.SheetReplicator(store, worksheet, retries=1).push_changes()
+
+    assert worksheet.data_rows() == [["2026/10/01", "10:00", "remB", "u1", "待發送"]]
+    assert _rows(store) == {"remB": ("待發送", 2, 0)}
+
+
+def test_append_is_only_checked_against_column_f_after_a_failure(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "A", "u1", "待發送")])
+    replicator.push_changes()
+    store.add_rows([("2026/10/01", "11:00", "B", "u1", "待發送")])
+    reads = worksheet.reads
+
+    replicator.push_changes()
+
+    assert worksheet.reads == reads
+
+
+def test_push_writes_status_back(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "B", "u1", "待發送")])
+    replicator.push_changes()
+
+    _send(store, "B")
+    replicator.push_changes()
+
+    assert worksheet.data_rows() == [["2026/10/01", "10:00", "B", "u1", "已發送"]]
+    assert _rows(store)["B"] == ("已發送", 2, 0)
+
+
+def test_pull_merges_added_edited_and_deleted_rows(store, worksheet, replicator):
+    store.add_rows([
+        ("2026/10/01", "09:00", "A", "u1", "待發送"),
+        ("2026/10/01", "10:00", "B", "u1", "待發送"),
+    ])
+    replicator.push_changes()
+    version = store.version()
+
+    worksheet.rows[1][2] = "A2"
+    del worksheet.rows[2]
+    worksheet.rows.append(["2026/10/02", "08:00", "C", "u2", "待發送"])
+    replicator.pull_changes()
+
+    assert _rows(store) == {"A2": ("待發送", 2, 0), "C": ("待發送", 3, 0)}
+    assert store.version() > version
+    # 人工新增的列會補寫識別碼
+    with store.connect() as conn:
+        assert worksheet.rows[2][5] == _key(store, conn.execute("SELECT id FROM schedules WHERE content = 'C'").fetchone()[0])
+    assert replicator.conflict_count == 0
+
+
+def test_deleted_row_above_is_a_move_not_a_conflict(store, worksheet, replicator):
+    store.add_rows([
+        ("2026/10/01", "09:00", "A", "u1", "已發送"),
+        ("2026/10/01", "10:00", "remB", "u1", "待發送"),
+        ("2026/10/01", "11:00", "remC", "u1", "待發送"),
+    ])
+    replicator.push_changes()
+
+    _send(store, "remB")
+    del worksheet.rows[1]
+    replicator.pull_changes()
+    replicator.push_changes()
+
+    assert worksheet.data_rows() == [
+        ["2026/10/01", "10:00", "remB", "u1", "已發送"],
+        ["2026/10/01", "11:00", "remC", "u1", "待發送"],
+    ]
+    assert _rows(store) == {"remB": ("已發送", 2, 0), "remC": ("待發送", 3, 0)}
+    assert replicator.conflict_count == 0
+
+
+def test_status_push_follows_rows_moved_after_the_last_pull(store, worksheet, replicator):
+    store.add_rows([
+        ("2026/10/01", "09:00", "A", "u1", "已發送"),
+        ("2026/10/01", "10:00", "remB", "u1", "待發送"),
+    ])
+    replicator.push_changes()
+
+    _send(store, "remB")
+    worksheet.rows.insert(1, ["2026/10/02", "08:00", "human", "u2", "待發送"])
+    replicator.push_changes()
+
+    assert worksheet.data_rows() == [
+        ["2026/10/02", "08:00", "human", "u2", "待發送"],
+        ["2026/10/01", "09:00", "A", "u1", "已發送"],
+        ["2026/10/01", "10:00", "remB", "u1", "已發送"],
+    ]
+
+
+def test_conflicting_edit_keeps_local_status(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "B", "u1", "待發送")])
+    replicator.push_changes()
+
+    _send(store, "B")
+    worksheet.rows[1][1] = "10:30"
+    replicator.pull_changes()
+
+    with store.connect() as conn:
+        assert conn.execute("SELECT time, status, dirty FROM schedules").fetchone() == ("10:30", "已發送", 1)
+    assert replicator.conflict_count == 1
+
+    replicator.push_changes()
+    assert worksheet.data_rows() == [["2026/10/01", "10:30", "B", "u1", "已發送"]]
+
+
+def test_edit_pulled_while_a_reminder_is_being_sent_keeps_the_claim(store, worksheet, replicator):
+    [row_id] = store.add_rows([("2026/10/01", "10:00", "remB", "u1", "待發送")])
+    replicator.push_changes()
+
+    assert store.claim(row_id)
+    worksheet.rows[1][2] = "remB2"
+    replicator.pull_changes()
+    assert store.pending_reminders() == []
+    assert store.confirm(row_id, "已發送")
+    replicator.push_changes()
+
+    assert worksheet.data_rows() == [["2026/10/01", "10:00", "remB2", "u1", "已發送"]]
+    assert _rows(store) == {"remB2": ("已發送", 2, 0)}
+
+
+def test_deleted_row_with_local_changes_is_written_again(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "B", "u1", "待發送")])
+    replicator.push_changes()
+
+    _send(store, "B")
+    del worksheet.rows[1]
+    replicator.pull_changes()
+    replicator.push_changes()
+
+    assert worksheet.data_rows() == [["2026/10/01", "10:00", "B", "u1", "已發送"]]
+
+
+def test_duplicated_row_becomes_a_new_schedule(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "B", "u1", "待發送")])
+    replicator.push_changes()
+
+    worksheet.rows.append(list(worksheet.rows[1]))
+    replicator.pull_changes()
+
+    with store.connect() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM schedules ORDER BY sheet_row")]
+    assert len(ids) == 2
+    assert [cells[5] for cells in worksheet.rows[1:]] == [_key(store, row_id) for row_id in ids]
+
+
+def test_legacy_rows_without_ids_are_matched_by_content(store, replicator):
+    # 舊版只寫 A～E 欄：依內容對應本地資料，不會重複新增
+    legacy = FakeWorksheet([HEADER, ["2026/10/01", "09:00", "A", "u1", "已發送"], ["2026/10/01", "10:00", "B", "u1", "待發送"]])
+    replicator.worksheet = legacy
+    replicator.pull_changes()
+    with store.connect() as conn:
+        conn.execute("UPDATE schedules SET keyed = 0")
+        before = dict(conn.execute("SELECT content, id FROM schedules"))
+    for cells in legacy.rows[1:]:
+        del cells[5:]
+
+    del legacy.rows[1]
+    replicator.pull_changes()
+
+    with store.connect() as conn:
+        after = dict(conn.execute("SELECT content, id FROM schedules"))
+    assert after == {"B": before["B"]}
+    assert legacy.rows[1][5] == _key(store, before["B"])
+
+
+def test_unchanged_sheet_is_not_read_again(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "B", "u1", "待發送")])
+    replicator.push_changes()
+    replicator.pull_changes()
+    reads = worksheet.reads
+
+    replicator.pull_changes()
+    assert worksheet.reads == reads
+
+    worksheet.rows[1][2] = "B2"
+    replicator.pull_changes()
+    assert worksheet.reads > reads
+    assert _rows(store) == {"B2": ("待發送", 2, 0)}
+
+
+def test_status_push_checks_remembered_rows_with_one_read_when_the_sheet_is_unchanged(store, worksheet, replicator):
+    store.add_rows([("2026/10/01", "10:00", "B", "u1", "待發送")])
+    replicator.push_changes()
+    replicator.pull_changes()
+    reads = worksheet.reads
+
+    _send(store, "B")
+    replicator.push_changes()
+
+    assert worksheet.reads == reads + 1
+    assert worksheet.data_rows() == [["2026/10/01", "10:00", "B", "u1", "已發送"]]
+
+
+def test_status_push_follows_moved_rows_when_the_modified_time_lags(store, worksheet, replicator):
+    store.add_rows([
+        ("2026/10/01", "09:00", "remA", "u1", "待發送"),
+        ("2026/10/01", "10:00", "remB", "u1", "待發送"),
+    ])
+    replicator.push_changes()
+    replicator.pull_changes()
+
+    # Drive 的修改時間還沒反映人工刪除的列
+    worksheet.stale_modified = worksheet.get_lastUpdateTime()
+    del worksheet.rows[1]
+    worksheet.rows.append(["2026/10/02", "08:00", "human", "u2", "待發送"])
+    _send(store, "remB")
+    replicator.push_changes()
+
+    assert worksheet.data_rows() == [
+        ["2026/10/01", "10:00", "remB", "u1", "已發送"],
+        ["2026/10/02", "08:00", "human", "u2", "待發送"],
+    ]
+
+
+def test_ids_written_by_another_database_are_matched_by_content(store, worksheet, replicator):
+    # 重建前的資料庫寫入的識別碼，而且補寫新識別碼失敗
+    worksheet.rows += [
+        ["2026/10/01", "09:00", "A", "u1", "待發送", "2"],
+        ["2026/10/01", "10:00", "B", "u1", "待發送", "1"],
+    ]
+    worksheet.fail_on.add("batch_update")
+    replicator.pull_changes()
+    with store.connect() as conn:
+        before = dict(conn.execute("SELECT content, id FROM schedules"))
+
+    replicator.pull_changes(force=True)
+    worksheet.fail_on.clear()
+    replicator.pull_changes(force=True)
+
+    with store.connect() as conn:
+        assert dict(conn.execute("SELECT content, id FROM schedules")) == before
+    assert [cells[5] for cells in worksheet.rows[1:]] == [_key(store, before["A"]), _key(store, before["B"])]
@@ -0,0 +1,28 @@
+import app
+
+
+def test_import_does_not_start_background_services():
+    assert app._background_pid is None
+    assert not app.scheduler.running
+
+
+def test_first_request_starts_background_services(monkeypatch):
+    started = []
+    monkeypatch.setattr(app, "start_background_services", lambda: started.append(True))
+
+    client = app.app.test_client()
+    assert client.get("/").status_code == 200
+
+    assert started
+
+
+def test_shutdown_pushes_pending_rows_after_draining_webhooks(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app.webhook_queue, "drain", lambda: calls.append("drain"))
+    monkeypatch.setattr(app.sheet_replicator, "push_changes", lambda: calls.append("push"))
+    monkeypatch.setattr(app.leader_elector, "stop", lambda: calls.append("stop"))
+    monkeypatch.setattr(app.leader_elector, "is_leader", True)
+
+    app.stop_background_services()
+
+    assert calls == ["drain", "push", "stop"]